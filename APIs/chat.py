@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+from APIs.llm import llm
+
+
+def system_prompt(problem):
+    return f"""
+        You are an interview assistant. You are presenting a coding problem to the user and helping them through the problem.
+
+        You must not give away the solution directly. If the user asks for hints, provide only subtle hints that guide them in the right direction. Only give hints if the user provides context about their current progress or what they have tried so far. Also, don't answer more than what is needed. If a user asks something that can be answered in a yes or no response, return just yes or no
+
+        Make your answers short and concise. No more than 2 sentences
+
+        Here is the problem: \n\n"
+        {problem}\n\n"
+        Remember, do not give the solution directly.
+        """
+
+
+def chat_messages(prompt, problem):
+    return [
+        {"role": "system", "content": system_prompt(problem)},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def complete_chat(messages):
+    return llm.complete("chat", messages)
+
+
+def get_ai_response(prompt, problem):
+    return complete_chat(chat_messages(prompt, problem))
+
+
+class StreamMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "streams": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "first_token_total": 0.0,
+            "first_token_max": 0.0,
+            "first_tokens": 0,
+            "total_time_total": 0.0,
+            "total_time_max": 0.0,
+        }
+
+    def record(self, outcome, first_token, total):
+        with self._lock:
+            self._stats["streams"] += 1
+            self._stats[outcome] += 1
+            if first_token is not None:
+                self._stats["first_tokens"] += 1
+                self._stats["first_token_total"] += first_token
+                self._stats["first_token_max"] = max(self._stats["first_token_max"], first_token)
+            self._stats["total_time_total"] += total
+            self._stats["total_time_max"] = max(self._stats["total_time_max"], total)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        first_tokens = stats.pop("first_tokens")
+        stats["first_token_avg"] = (
+            stats.pop("first_token_total") / first_tokens if first_tokens else None
+        )
+        stats["total_time_avg"] = (
+            stats.pop("total_time_total") / stats["streams"] if stats["streams"] else None
+        )
+        return stats
+
+
+chat_stream_metrics = StreamMetrics()
+
+
+def stream_ai_response(messages, metrics=chat_stream_metrics):
+    # Opens the stream right away so an unavailable upstream is reported
+    # before the response starts, then yields content deltas as the model
+    # produces them. Closing the returned generator (the client went away)
+    # closes the upstream response too, so the model stops generating tokens
+    # nobody will read.
+    started = time.monotonic()
+    upstream = llm.stream("chat", messages)
+    return _metered(upstream, started, metrics)
+
+
+def _metered(upstream, started, metrics):
+    first_token = None
+    outcome = "cancelled"
+    try:
+        for delta in upstream:
+            if first_token is None:
+                first_token = time.monotonic() - started
+            yield delta
+        outcome = "completed"
+    except Exception as e:
+        outcome = "failed"
+        logging.error(f"Chat stream failed: {str(e)}")
+        raise
+    finally:
+        upstream.close()
+        metrics.record(outcome, first_token, time.monotonic() - started)
@@ -0,0 +1,117 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+from APIs.chat import system_prompt
+from APIs.llm import estimate_tokens
+from database.cache import make_cache
+from database.config import PROFILE_CACHE_ADDRESS, PROFILE_CACHE_AUTHKEY, PROFILE_CACHE_BACKEND
+from database.models import problem_hash
+
+load_dotenv()
+
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "7200"))
+CHAT_SESSION_LIMIT = int(os.getenv("CHAT_SESSION_LIMIT", "4096"))
+# Budget for the replayed turns; the system prompt and new message come on top
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1200"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "20"))
+
+SUMMARY_LINE_CHARS = 160
+
+
+def shorten(text, limit=SUMMARY_LINE_CHARS):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+class ChatSessions:
+    # Sessions are keyed by user and problem hash and hold the problem once,
+    # the most recent turns, and a short note of the questions that were
+    # trimmed off so the prompt size stays flat as the conversation grows.
+    def __init__(
+        self,
+        store,
+        ttl=CHAT_SESSION_TTL,
+        history_tokens=CHAT_HISTORY_TOKENS,
+        summary_tokens=CHAT_SUMMARY_TOKENS,
+        max_turns=CHAT_MAX_TURNS,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(uid, session_id):
+        return f"chat:{uid}:{session_id}"
+
+    def start(self, uid, problem, reset=False):
+        # Resumes the user's session for this problem unless asked to reset
+        session_id = problem_hash(problem)
+        key = self._key(uid, session_id)
+        with self._lock:
+            session = None if reset else self.store.get(key)
+            if session is None:
+                self.store.set(key, {"problem": problem, "summary": [], "turns": []}, self.ttl)
+        return session_id
+
+    def messages(self, uid, session_id, message):
+        session = self.store.get(self._key(uid, session_id))
+        if session is None:
+            return None
+
+        messages = [{"role": "system", "content": system_prompt(session["problem"])}]
+        if session["summary"]:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": "Earlier in this conversation the user asked:\n"
+                    + "\n".join(session["summary"]),
+                }
+            )
+        messages.extend({"role": role, "content": content} for role, content in session["turns"])
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def record(self, uid, session_id, message, reply):
+        key = self._key(uid, session_id)
+        with self._lock:
+            session = self.store.get(key)
+            if session is None:
+                return
+            turns = session["turns"] + [["user", message], ["assistant", reply]]
+            summary = list(session["summary"])
+
+            while len(turns) > 2 and (
+                len(turns) > self.max_turns
+                or sum(estimate_tokens(content) for _, content in turns) > self.history_tokens
+            ):
+                role, content = turns.pop(0)
+                if role == "user":
+                    summary.append(f"- {shorten(content)}")
+            while summary and sum(estimate_tokens(line) for line in summary) > self.summary_tokens:
+                summary.pop(0)
+
+            self.store.set(
+                key, {"problem": session["problem"], "summary": summary, "turns": turns}, self.ttl
+            )
+
+    def end(self, uid, session_id):
+        self.store.delete(self._key(uid, session_id))
+
+
+# Uses the profile cache backend so sessions are visible to every worker when
+# the shared cache process is configured
+chat_sessions = ChatSessions(
+    make_cache(
+        PROFILE_CACHE_BACKEND,
+        CHAT_SESSION_LIMIT,
+        CHAT_SESSION_TTL,
+        PROFILE_CACHE_ADDRESS,
+        PROFILE_CACHE_AUTHKEY,
+        name="chat_sessions",
+    )
+)
@@ -1,15 +1,140 @@
+import ast
+import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextvars import Context, copy_context
 from dotenv import load_dotenv
-import openai
 
-load_dotenv()
-
-openai.api_key = os.getenv("OPEN_AI_API_KEY")
+from APIs.evaluationCache import (
+    cached_evaluation,
+    detect_language,
+    normalize_text,
+    normalize_whitespace,
+    strip_comments,
+)
+from APIs.llm import estimate_tokens, llm, llm_scope
+from APIs.upstream import UpstreamUnavailable, deadline, time_left
+from APIs.usage import reset_endpoint, set_endpoint
 
+load_dotenv()
 
-def evaluate_response(prompt, user_response):
-    gpt_prompt = f"""
+EVALUATION_TIMEOUT = float(os.getenv("EVALUATION_TIMEOUT", "60"))
+# "separate" grades code and speech with two requests; "combined" sends the
+# problem and code once and grades both in a single structured response
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "separate")
+# Comments, blank lines and repeated transcript segments are dropped before
+# grading, and anything still over these ceilings is cut in the middle
+EVALUATION_COMPACT = os.getenv("EVALUATION_COMPACT", "true").lower() in ("1", "true", "yes")
+EVALUATION_CODE_TOKENS = int(os.getenv("EVALUATION_CODE_TOKENS", "2000"))
+EVALUATION_SPEECH_TOKENS = int(os.getenv("EVALUATION_SPEECH_TOKENS", "1500"))
+
+# Repeats shorter than this are kept: stutters say something about clarity,
+# longer repeats are speech-to-text re-emitting a segment
+MIN_REPEAT_WORDS = 4
+MAX_REPEAT_WORDS = 20
+
+# Shared by every request so code and speech grading run side by side without
+# spawning threads per call. Work is submitted with a copy of the caller's
+# context so request-scoped settings (see APIs.llm) follow it into the pool.
+evaluation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EVALUATION_WORKERS", "16")),
+    thread_name_prefix="evaluation",
+)
+
+# Batch items are graded EVALUATION_BATCH_CONCURRENCY at a time per process,
+# each of them fanning out to evaluation_executor like a single submission
+EVALUATION_BATCH_LIMIT = int(os.getenv("EVALUATION_BATCH_LIMIT", "100"))
+EVALUATION_BATCH_CONCURRENCY = int(os.getenv("EVALUATION_BATCH_CONCURRENCY", "8"))
+# Graded batch items are saved once this many are waiting, or this many
+# seconds after the last save
+EVALUATION_BATCH_SAVE_EVERY = int(os.getenv("EVALUATION_BATCH_SAVE_EVERY", "10"))
+EVALUATION_BATCH_SAVE_INTERVAL = float(os.getenv("EVALUATION_BATCH_SAVE_INTERVAL", "5"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=EVALUATION_BATCH_CONCURRENCY, thread_name_prefix="evaluation-batch"
+)
+
+
+def truncate_middle(parts, max_tokens, unit):
+    # Keeps the start and the end (the signature and the return, the opening
+    # and the conclusion) and drops whole lines or words from the middle
+    if sum(estimate_tokens(part) for part in parts) <= max_tokens:
+        return parts
+    start, end = 0, len(parts)
+    budget = max_tokens
+    while start < end:
+        index = start if start <= len(parts) - end else end - 1
+        cost = estimate_tokens(parts[index])
+        if cost > budget:
+            break
+        budget -= cost
+        if index == start:
+            start += 1
+        else:
+            end -= 1
+    return parts[:start] + [f"[... {end - start} {unit} omitted ...]"] + parts[end:]
+
+
+def same_python(original, compacted):
+    try:
+        return ast.dump(ast.parse(original)) == ast.dump(ast.parse(compacted))
+    except (SyntaxError, ValueError, RecursionError):
+        return False
+
+
+def compact_code(code, max_tokens=EVALUATION_CODE_TOKENS):
+    # Trailing whitespace and blank lines always go; comments (including
+    # commented-out attempts) only from Python. Python that compiles must
+    # still compile to the same syntax tree afterwards, or the lesser
+    # compaction (or the code as submitted) is graded instead.
+    language = detect_language(code)
+    compacted = normalize_whitespace(strip_comments(code, language))
+    if language == "python":
+        try:
+            ast.parse(code)
+        except (SyntaxError, ValueError, RecursionError):
+            compacted = normalize_whitespace(code)
+        else:
+            if not same_python(code, compacted):
+                compacted = normalize_whitespace(code)
+                if not same_python(code, compacted):
+                    compacted = code
+    return "\n".join(truncate_middle(compacted.split("\n"), max_tokens, "lines"))
+
+
+def dedupe_transcript(words):
+    # Drops a run of words that immediately repeats the run before it
+    kept, keys = [], []
+    for word in words:
+        kept.append(word)
+        keys.append(word.lower().strip(",.?!;:"))
+        for size in range(MIN_REPEAT_WORDS, min(MAX_REPEAT_WORDS, len(keys) // 2) + 1):
+            if keys[-size:] == keys[-2 * size : -size]:
+                del kept[-size:], keys[-size:]
+                break
+    return kept
+
+
+def compact_speech(speech, max_tokens=EVALUATION_SPEECH_TOKENS):
+    words = dedupe_transcript(normalize_text(speech).split(" "))
+    return " ".join(truncate_middle(words, max_tokens, "words"))
+
+
+def compact_submission(user_response, user_speech=None):
+    # Returns the compacted code and speech and the estimated input tokens
+    # saved on each
+    code = compact_code(user_response)
+    saved = {"code": max(0, estimate_tokens(user_response) - estimate_tokens(code))}
+    speech = None
+    if user_speech is not None:
+        speech = compact_speech(user_speech)
+        saved["speech"] = max(0, estimate_tokens(user_speech) - estimate_tokens(speech))
+    return code, speech, saved
+
+
+def code_prompt(prompt, user_response):
+    return f"""
     Here is a coding problem and a user's response. Evaluate the response and provide feedback on a scale from 1-10, with 1 being "Needs a lot of work" to 10 being "Excellent". 
     
     Problem:
@@ -29,16 +154,17 @@ def evaluate_response(prompt, user_response):
     Final Grade: [Give a single number out of 10. JUST THE NUMBER AS A WHOLE NUMBER]
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o", messages=[{"role": "user", "content": gpt_prompt}]
-    )
-    evaluation = response.choices[0].message["content"].strip()
 
-    return evaluation
+def evaluate_response(prompt, user_response, timeout=None):
+    gpt_prompt = code_prompt(prompt, user_response)
+
+    return llm.complete(
+        "evaluate_code", [{"role": "user", "content": gpt_prompt}], timeout
+    )
 
 
-def evaluate_speech(prompt, user_response, user_speech):
-    gpt_prompt = f"""
+def speech_prompt(prompt, user_response, user_speech):
+    return f"""
     Here is a coding problem and a user's response. Evaluate the response and the user's speech, providing feedback on a scale from 1-10, with 1 being "Needs a lot of work" to 10 being "Excellent".
 
     Do not grade on function signature or class structure as those are given to the user. 
@@ -64,12 +190,53 @@ def evaluate_speech(prompt, user_response, user_speech):
     {user_speech}
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4", messages=[{"role": "user", "content": gpt_prompt}]
+
+def evaluate_speech(prompt, user_response, user_speech, timeout=None):
+    gpt_prompt = speech_prompt(prompt, user_response, user_speech)
+
+    return llm.complete(
+        "evaluate_speech", [{"role": "user", "content": gpt_prompt}], timeout
     )
-    evaluation = response.choices[0].message["content"].strip()
 
-    return evaluation
+
+def combined_prompt(prompt, user_response, user_speech):
+    return f"""
+    Here is a coding problem, a user's code response and a transcript of what they said while solving it. Grade the code and the speech separately, each on a scale from 1-10, with 1 being "Needs a lot of work" to 10 being "Excellent".
+
+    For the code, do not grade on function signature or class structure as those are given to the user, and don't grade too harshly on indentation as they are not using an IDE.
+
+    For the speech, use the following criteria:
+    - Clarity: How clearly they communicated their thoughts.
+    - Questions Asked: The relevance and quality of questions they asked.
+    - Relevancy: How relevant their speech was to the problem.
+    - Confidence: How confidently they presented their ideas.
+
+    DO NOT RETURN ANY MARKDOWN. Structure your feedback exactly as follows:
+
+    Code Evaluation: [Describe how their code did overall]
+    Code Feedback: [Provide detailed feedback on how they can improve their code]
+    Code Final Grade: [Give a single number out of 10. JUST THE NUMBER AS A WHOLE NUMBER]
+    Speech Evaluation: [Describe how their communication went overall]
+    Speech Feedback: [Provide detailed feedback on how they can communicate better]
+    Speech Final Grade: [Give a single number out of 10. JUST THE NUMBER AS A WHOLE NUMBER]
+
+    Problem:
+    {prompt}
+
+    User's Response:
+    {user_response}
+
+    User's Speech:
+    {user_speech}
+    """
+
+
+def evaluate_combined(prompt, user_response, user_speech, timeout=None):
+    gpt_prompt = combined_prompt(prompt, user_response, user_speech)
+
+    return llm.complete(
+        "evaluate_combined", [{"role": "user", "content": gpt_prompt}], timeout
+    )
 
 
 def parse_evaluation(response):
@@ -80,14 +247,200 @@ def parse_evaluation(response):
     evaluation_match = re.search(evaluation_pattern, response, re.DOTALL)
     feedback_match = re.search(feedback_pattern, response, re.DOTALL)
     grade_match = re.search(grade_pattern, response)
+    if not grade_match:
+        # A reply without a grade (malformed or cut off) must not be saved or
+        # cached as a 0
+        raise ValueError("Evaluation has no final grade")
 
     evaluation = evaluation_match.group(1).strip() if evaluation_match else ""
     feedback = feedback_match.group(1).strip() if feedback_match else ""
-    final_grade = int(grade_match.group(1)) if grade_match else 0
+    final_grade = int(grade_match.group(1))
 
     return evaluation, feedback, final_grade
 
 
+class PartialEvaluation(ValueError):
+    # A combined reply with only one usable half; carries that half so it is
+    # not thrown away, while the reply itself is still not cached
+    def __init__(self, message, code=None, speech=None):
+        super().__init__(message)
+        self.code = code
+        self.speech = speech
+
+
+def _parse_half(part):
+    try:
+        return parse_evaluation(part)
+    except ValueError:
+        return None
+
+
+def parse_combined_evaluation(response):
+    # Splits a combined response into the same (evaluation, feedback, grade)
+    # tuples parse_evaluation returns for the code and speech sides
+    code_part, separator, speech_part = response.partition("Speech Evaluation:")
+    code_part = re.sub(r"Code (Evaluation|Feedback|Final Grade):", r"\1:", code_part)
+    code = _parse_half(code_part)
+    if not separator:
+        raise PartialEvaluation("Combined evaluation is missing the speech section", code=code)
+
+    speech_part = "Evaluation:" + re.sub(
+        r"Speech (Feedback|Final Grade):", r"\1:", speech_part
+    )
+    speech = _parse_half(speech_part)
+    if code is None or speech is None:
+        missing = "code" if code is None else "speech"
+        raise PartialEvaluation(
+            f"Combined evaluation has no {missing} grade", code=code, speech=speech
+        )
+    return code, speech
+
+
+def evaluate_submission(
+    prompt, user_response, user_speech=None, timeout=EVALUATION_TIMEOUT, mode=None
+):
+    # Grades code and (optionally) speech concurrently. Returns parsed
+    # (evaluation, feedback, grade) tuples for each side, None for a side that
+    # was skipped or failed, the error message of any side that failed, and
+    # metadata saying whether each side was served from the evaluation cache
+    # and how many prompt tokens compaction saved. UpstreamUnavailable is
+    # raised rather than reported when the code side cannot be graded because
+    # the model is unavailable. If a combined reply only has one usable half,
+    # the other half is graded again on its own.
+    timeout = time_left(timeout)
+    started = time.monotonic()
+    meta = {"cache": {}}
+    if EVALUATION_COMPACT:
+        user_response, user_speech, meta["tokens_saved"] = compact_submission(
+            user_response, user_speech
+        )
+    if user_speech is not None and (mode or EVALUATION_MODE) == "combined":
+        future = evaluation_executor.submit(
+            copy_context().run,
+            cached_evaluation,
+            "combined",
+            evaluate_combined,
+            parse_combined_evaluation,
+            prompt,
+            user_response,
+            user_speech,
+            timeout=timeout,
+        )
+        try:
+            (code_result, speech_result), hit = future.result(timeout)
+        except UpstreamUnavailable:
+            raise
+        except PartialEvaluation as e:
+            logging.warning(f"{str(e)}; grading the rest separately")
+            results = {"code": e.code, "speech": e.speech}
+            for side, result in results.items():
+                if result is not None:
+                    meta["cache"][side] = "miss"
+            meta["combined_fallback"] = [side for side, result in results.items() if result is None]
+            remaining = timeout - (time.monotonic() - started)
+            if remaining > 0:
+                return _evaluate_separately(
+                    prompt, user_response, user_speech, remaining, meta, results
+                )
+            errors = {
+                side: f"{side} evaluation timed out after {timeout}s"
+                for side in meta["combined_fallback"]
+            }
+            return results["code"], results["speech"], errors, meta
+        except Exception as e:
+            future.cancel()
+            error = f"combined evaluation failed: {str(e) or type(e).__name__}"
+            return None, None, {"code": error, "speech": error}, meta
+        meta["cache"]["code"] = meta["cache"]["speech"] = "hit" if hit else "miss"
+        return code_result, speech_result, {}, meta
+
+    return _evaluate_separately(
+        prompt, user_response, user_speech, timeout, meta, {"code": None, "speech": None}
+    )
+
+
+def _evaluate_separately(prompt, user_response, user_speech, timeout, meta, results):
+    # Grades the sides that have no result yet, each with its own request
+    futures = {}
+    if results["code"] is None:
+        futures["code"] = evaluation_executor.submit(
+            copy_context().run,
+            cached_evaluation,
+            "code",
+            evaluate_response,
+            parse_evaluation,
+            prompt,
+            user_response,
+            timeout=timeout,
+        )
+    if user_speech is not None and results["speech"] is None:
+        futures["speech"] = evaluation_executor.submit(
+            copy_context().run,
+            cached_evaluation,
+            "speech",
+            evaluate_speech,
+            parse_evaluation,
+            prompt,
+            user_response,
+            user_speech,
+            timeout=timeout,
+        )
+
+    wait(futures.values(), timeout=timeout)
+
+    errors = {}
+    for side, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[side] = f"{side} evaluation timed out after {timeout}s"
+            continue
+        try:
+            results[side], hit = future.result()
+        except UpstreamUnavailable as e:
+            if side == "code":
+                raise
+            errors[side] = f"{side} evaluation failed: {str(e)}"
+            continue
+        except Exception as e:
+            errors[side] = f"{side} evaluation failed: {str(e)}"
+            continue
+        meta["cache"][side] = "hit" if hit else "miss"
+
+    return results["code"], results["speech"], errors, meta
+
+
+def _evaluate_item(item, mode, endpoint):
+    # Runs in a fresh context: each item gets its own deadline instead of
+    # sharing what is left of the batch request's
+    uid, problem, user_response, user_speech = item
+    token = set_endpoint(endpoint)
+    try:
+        with deadline(EVALUATION_TIMEOUT), llm_scope(uid):
+            return evaluate_submission(problem, user_response, user_speech, mode=mode)
+    finally:
+        reset_endpoint(token)
+
+
+def evaluate_batch(items, mode=None, endpoint=None):
+    # items are (uid, problem, user_response, user_speech) tuples. Yields
+    # (index, result) in completion order, where result is what
+    # evaluate_submission returned or the exception it raised. Closing the
+    # generator cancels the items that have not started yet.
+    futures = {
+        batch_executor.submit(Context().run, _evaluate_item, item, mode, endpoint): index
+        for index, item in enumerate(items)
+    }
+    try:
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        for future in futures:
+            future.cancel()
+
+
 # Example for proof of concept
 
 
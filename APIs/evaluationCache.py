@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+from database.cache import TTLCache
+
+load_dotenv()
+
+EVALUATION_CACHE = os.getenv("EVALUATION_CACHE", "true").lower() in ("1", "true", "yes")
+EVALUATION_CACHE_SIZE = int(os.getenv("EVALUATION_CACHE_SIZE", "1024"))
+EVALUATION_CACHE_TTL = float(os.getenv("EVALUATION_CACHE_TTL", "86400"))
+# Optional second tier on local disk, shared by every worker on the host
+EVALUATION_CACHE_PATH = os.getenv("EVALUATION_CACHE_PATH", "")
+EVALUATION_CACHE_DISK_ENTRIES = int(os.getenv("EVALUATION_CACHE_DISK_ENTRIES", "100000"))
+
+# Bump when the grading prompts change so stale grades are not served
+CACHE_VERSION = "2"
+
+# String literals first so comment markers inside them are left alone
+_STRING = r"\"\"\"[\s\S]*?\"\"\"|'''[\s\S]*?'''|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'"
+_HASH_COMMENT = re.compile(rf"({_STRING})|#[^\n]*")
+_PYTHON_HINT = re.compile(
+    r"^\s*(def\s+\w+\s*\(|class\s+\w+|import\s+\w|from\s+[\w.]+\s+import\b|elif\b)",
+    re.MULTILINE,
+)
+# A statement or block ending in ; { or }, optionally followed by a // comment
+_C_HINT = re.compile(r"[;{}]\s*(//.*)?$", re.MULTILINE)
+
+
+def detect_language(code):
+    # "python", "c-like" or None when the code does not clearly look like one
+    # of them. Comment syntax is only trusted for a clear match: // is floor
+    # division in Python and # a preprocessor line or private field elsewhere.
+    python = bool(_PYTHON_HINT.search(code))
+    c_like = bool(_C_HINT.search(code))
+    if python and not c_like:
+        return "python"
+    if c_like and not python:
+        return "c-like"
+    return None
+
+
+def strip_comments(code, language=None):
+    # Python only: the caller can check the result against the syntax tree.
+    # There is no such check for C-like code, and a regex misses its template
+    # literals and raw strings (`https://...` would lose everything after //),
+    # so that code is left as written.
+    language = language or detect_language(code)
+    if language != "python":
+        return code
+    return _HASH_COMMENT.sub(lambda match: match.group(1) or "", code)
+
+
+def normalize_whitespace(text):
+    lines = (line.rstrip() for line in text.expandtabs(4).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def evaluation_key(kind, problem, user_response, user_speech=None):
+    # Only whitespace is normalized in the code: anything lossier (comment
+    # stripping) could give two different programs the same key
+    parts = [CACHE_VERSION, kind, normalize_text(problem), normalize_whitespace(user_response)]
+    if user_speech is not None:
+        parts.append(normalize_text(user_speech))
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+
+    def _connection(self):
+        # sqlite connections must not cross a fork, so each worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_evaluations_accessed ON evaluations (accessed_at)"
+            )
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM evaluations WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE evaluations SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO evaluations (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._writes += 1
+            # Trimming is amortized over writes rather than paid on every insert
+            if self._writes % 100 == 0:
+                self._trim(conn, now)
+            conn.commit()
+
+    def _trim(self, conn, now):
+        conn.execute("DELETE FROM evaluations WHERE expires_at <= ?", (now,))
+        conn.execute(
+            """
+            DELETE FROM evaluations WHERE key IN (
+                SELECT key FROM evaluations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+
+class EvaluationCache:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_errors": 0}
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except Exception as e:
+                self._count("disk_errors")
+                logging.warning(f"Evaluation disk cache read failed: {str(e)}")
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.set(key, value)
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                self._count("disk_errors")
+                logging.warning(f"Evaluation disk cache write failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["memory"] = self.memory.stats()
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def make_evaluation_cache():
+    if not EVALUATION_CACHE:
+        return None
+    disk = None
+    if EVALUATION_CACHE_PATH:
+        disk = DiskCache(EVALUATION_CACHE_PATH, EVALUATION_CACHE_TTL, EVALUATION_CACHE_DISK_ENTRIES)
+    return EvaluationCache(TTLCache(EVALUATION_CACHE_SIZE, EVALUATION_CACHE_TTL), disk)
+
+
+evaluation_cache = make_evaluation_cache()
+
+
+def cached_evaluation(kind, evaluate, parse, *args, timeout=None):
+    # args are (problem, user_response[, user_speech]). Returns the parsed
+    # result and whether it came from the cache. parse must raise on a reply
+    # it cannot use (e.g. one without a grade); only replies that parse are
+    # stored, so a malformed reply is retried on the next submission.
+    if evaluation_cache is None:
+        return parse(evaluate(*args, timeout)), False
+
+    key = evaluation_key(kind, *args)
+    text = evaluation_cache.get(key)
+    if text is not None:
+        return parse(text), True
+
+    text = evaluate(*args, timeout)
+    result = parse(text)
+    evaluation_cache.set(key, text)
+    return result, False
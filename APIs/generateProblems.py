@@ -1,10 +1,4 @@
-import openai
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-openai.api_key = os.getenv("OPEN_AI_API_KEY")
+from APIs.llm import llm
 
 
 def generate_problem(
@@ -58,9 +52,8 @@ def generate_problem(
 
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4o", messages=[{"role": "user", "content": gpt_prompt}]
+    recommendation = llm.complete(
+        "generate_problem", [{"role": "user", "content": gpt_prompt}]
     )
-    recommendation = response.choices[0].message["content"].strip()
 
     return recommendation
@@ -1,39 +1,111 @@
-import requests
 import logging
+import os
+import threading
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
+from database.cache import TTLCache
 
-def getLeetCodeInfo(username):
-    query = f"""
-    {{
-        matchedUser(username: "{username}") {{
-            username
-            submitStats: submitStatsGlobal {{
-                acSubmissionNum {{
-                    difficulty
-                    count
-                    submissions
-                }}
-            }}
-        }}
-    }}
-  """
-
-    url = "https://leetcode.com/graphql"
+load_dotenv()
 
-    try:
-        response = requests.post(url, json={"query": query})
+LEETCODE_URL = os.getenv("LEETCODE_URL", "https://leetcode.com/graphql")
+LEETCODE_CONNECT_TIMEOUT = float(os.getenv("LEETCODE_CONNECT_TIMEOUT", "3"))
+LEETCODE_READ_TIMEOUT = float(os.getenv("LEETCODE_READ_TIMEOUT", "5"))
+LEETCODE_CACHE_SIZE = int(os.getenv("LEETCODE_CACHE_SIZE", "1024"))
+LEETCODE_CACHE_TTL = float(os.getenv("LEETCODE_CACHE_TTL", "3600"))
+LEETCODE_POOL_SIZE = int(os.getenv("LEETCODE_POOL_SIZE", "10"))
+
+STATS_QUERY = """
+query userStats($username: String!) {
+    matchedUser(username: $username) {
+        username
+        submitStats: submitStatsGlobal {
+            acSubmissionNum {
+                difficulty
+                count
+                submissions
+            }
+        }
+    }
+}
+"""
+
+# Order of the ratios getLeetCodeInfo returns
+DIFFICULTIES = ("All", "Easy", "Medium", "Hard")
+
+
+class LeetCodeClient:
+    # Keeps one pooled keep-alive session per process and caches each user's
+    # ratios, so repeated sign-ups and profile edits do not hit leetcode.com
+    def __init__(
+        self,
+        url=LEETCODE_URL,
+        timeout=(LEETCODE_CONNECT_TIMEOUT, LEETCODE_READ_TIMEOUT),
+        cache=None,
+        pool_size=LEETCODE_POOL_SIZE,
+    ):
+        self.url = url
+        self.timeout = timeout
+        if cache is None:
+            cache = TTLCache(LEETCODE_CACHE_SIZE, LEETCODE_CACHE_TTL)
+        self.cache = cache
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _get_session(self):
+        # Sockets must not be shared across a fork, so each worker opens its own
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def ratios(self, username):
+        # Returns (overall, easy, medium, hard) acceptance ratios, or None when
+        # the user does not exist or leetcode.com could not be reached
+        cached = self.cache.get(username)
+        if cached is not None:
+            return cached
+
+        response = self._get_session().post(
+            self.url,
+            json={"query": STATS_QUERY, "variables": {"username": username}},
+            timeout=self.timeout,
+        )
         response.raise_for_status()
 
         data = response.json()
         if "errors" in data:
             logging.error(f"GraphQL errors: {data['errors']}")
-            return "N/A"
+            return None
+        user = (data.get("data") or {}).get("matchedUser")
+        if user is None:
+            logging.warning(f"LeetCode user {username} not found")
+            return None
+
+        by_difficulty = {
+            stat["difficulty"]: average(int(stat["count"]), int(stat["submissions"]))
+            for stat in user["submitStats"]["acSubmissionNum"]
+        }
+        ratios = tuple(by_difficulty.get(difficulty, 0) for difficulty in DIFFICULTIES)
+        self.cache.set(username, ratios)
+        return ratios
+
 
-        stats = data["data"]["matchedUser"]["submitStats"]["acSubmissionNum"]
-        ratios = [
-            average(int(stat["count"]), int(stat["submissions"])) for stat in stats
-        ]
-        return ratios[0], ratios[1], ratios[2], ratios[3]
+leetcode_client = LeetCodeClient()
+
+
+def getLeetCodeInfo(username):
+    try:
+        ratios = leetcode_client.ratios(username)
+        return "N/A" if ratios is None else ratios
     except requests.RequestException as re:
         logging.error(f"RequestException: {str(re)}")
         return "N/A"
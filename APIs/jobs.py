@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context
+from dotenv import load_dotenv
+
+from APIs.upstream import UpstreamUnavailable, deadline
+from APIs.usage import reset_endpoint, set_endpoint
+from database.cache import make_cache
+from database.config import PROFILE_CACHE_ADDRESS, PROFILE_CACHE_AUTHKEY, PROFILE_CACHE_BACKEND
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Jobs waiting or running in this process; more are turned away with a 503
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "200"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "120"))
+# How long finished (and unclaimed) jobs are kept
+JOB_TTL = float(os.getenv("JOB_TTL", "600"))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "25"))
+JOB_LIMIT = int(os.getenv("JOB_LIMIT", "10000"))
+# gunicorn's default worker count; with the local cache backend a job is only
+# visible to the worker that ran it, so job mode is turned off when several
+# workers are configured this way
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Long polls re-read the store this often to see jobs finished by other workers
+POLL_INTERVAL = 0.25
+FINISHED = ("done", "failed")
+
+
+class JobQueue:
+    # Runs slow model-backed work off the request thread. Job state lives in
+    # `store` (the profile cache backend; only with the shared backend can
+    # any worker answer a poll) and expires after `ttl`; the work itself runs
+    # on this process's bounded executor. A job's result is the (body,
+    # status) pair its function returns.
+    def __init__(
+        self,
+        store,
+        workers=JOB_WORKERS,
+        queue_limit=JOB_QUEUE_LIMIT,
+        timeout=JOB_TIMEOUT,
+        ttl=JOB_TTL,
+        enabled=True,
+    ):
+        self.store = store
+        self.enabled = enabled
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._finished = threading.Condition()
+        self._executor = None
+        self._pid = None
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "queued": 0,
+            "running": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "run_total": 0.0,
+            "run_max": 0.0,
+        }
+
+    @staticmethod
+    def _key(job_id):
+        return f"job:{job_id}"
+
+    def submit(self, kind, endpoint, fn, *args):
+        with self._lock:
+            if self._stats["queued"] + self._stats["running"] >= self.queue_limit:
+                self._stats["rejected"] += 1
+                raise UpstreamUnavailable("Too many queued jobs, try again later", retry_after=5)
+            self._stats["submitted"] += 1
+            self._stats["queued"] += 1
+            executor = self._ensure_executor()
+
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "kind": kind, "status": "queued", "created_at": time.time()}
+        self.store.set(self._key(job_id), job, self.ttl)
+        try:
+            executor.submit(
+                Context().run, self._run, job, endpoint, time.monotonic(), fn, args
+            )
+        except Exception:
+            with self._lock:
+                self._stats["queued"] -= 1
+            self.store.delete(self._key(job_id))
+            raise
+        return job
+
+    def get(self, job_id):
+        return self.store.get(self._key(job_id))
+
+    def wait(self, job_id, timeout):
+        # Long poll: returns the job once it has finished or timeout passes,
+        # or None if it does not exist (or has expired)
+        end = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = end - time.monotonic()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                return job
+            with self._finished:
+                self._finished.wait(min(remaining, POLL_INTERVAL))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats["completed"] + stats["failed"]
+        started = finished + stats["running"]
+        stats["wait_avg"] = stats.pop("wait_total") / started if started else None
+        stats["run_avg"] = stats.pop("run_total") / finished if finished else None
+        stats["enabled"] = self.enabled
+        stats["workers"] = self.workers
+        stats["queue_limit"] = self.queue_limit
+        return stats
+
+    def _ensure_executor(self):
+        # Caller holds the lock; created lazily so each forked worker gets its
+        # own threads
+        if self._executor is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jobs")
+        return self._executor
+
+    def _run(self, job, endpoint, submitted, fn, args):
+        # Runs in a fresh context with its own deadline; usage is attributed
+        # to the endpoint the job was submitted through
+        started = time.monotonic()
+        with self._lock:
+            self._stats["queued"] -= 1
+            self._stats["running"] += 1
+            self._stats["wait_total"] += started - submitted
+            self._stats["wait_max"] = max(self._stats["wait_max"], started - submitted)
+        self.store.set(self._key(job["id"]), {**job, "status": "running"}, self.ttl)
+
+        token = set_endpoint(endpoint)
+        try:
+            with deadline(self.timeout):
+                body, status = fn(*args)
+            outcome = {"status": "done", "status_code": status, "result": body}
+        except UpstreamUnavailable as e:
+            outcome = {
+                "status": "failed",
+                "status_code": e.status,
+                "result": {"message": str(e)},
+                "retry_after": e.retry_after,
+            }
+        except Exception as e:
+            logging.error(f"{job['kind']} job {job['id']} failed: {str(e)}")
+            outcome = {
+                "status": "failed",
+                "status_code": 500,
+                "result": {"message": f"Failed to run {job['kind']}: {str(e)}"},
+            }
+        finally:
+            reset_endpoint(token)
+
+        self.store.set(self._key(job["id"]), {**job, **outcome}, self.ttl)
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats["running"] -= 1
+            self._stats["completed" if outcome["status"] == "done" else "failed"] += 1
+            self._stats["run_total"] += elapsed
+            self._stats["run_max"] = max(self._stats["run_max"], elapsed)
+        with self._finished:
+            self._finished.notify_all()
+
+
+def make_jobs():
+    shared = PROFILE_CACHE_BACKEND == "shared"
+    if not shared and WEB_CONCURRENCY > 1:
+        logging.warning(
+            "Async job mode is off: the local cache backend cannot share jobs between "
+            f"{WEB_CONCURRENCY} workers. Use PROFILE_CACHE_BACKEND=shared to enable it."
+        )
+    elif not shared:
+        logging.warning(
+            "Async jobs are kept in this worker's memory; with several workers, polls "
+            "reaching another worker return 404. Use PROFILE_CACHE_BACKEND=shared."
+        )
+    return JobQueue(
+        make_cache(
+            PROFILE_CACHE_BACKEND,
+            JOB_LIMIT,
+            JOB_TTL,
+            PROFILE_CACHE_ADDRESS,
+            PROFILE_CACHE_AUTHKEY,
+            name="jobs",
+        ),
+        enabled=shared or WEB_CONCURRENCY <= 1,
+    )
+
+
+jobs = make_jobs()
@@ -0,0 +1,534 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+import openai
+
+from APIs.modelRouting import ModelRouter, Route, parse_routes
+from APIs.upstream import (
+    CircuitBreaker,
+    ConcurrencyLimiter,
+    DeadlineExceeded,
+    UpstreamUnavailable,
+    backoff_delay,
+    deadline,
+    time_left,
+)
+from APIs.usage import UsageTracker, usage_user
+from database.writer import usage_writer
+
+load_dotenv()
+
+openai.api_key = os.getenv("OPEN_AI_API_KEY")
+
+# "openai" talks to the API; "fake" answers locally for load tests and
+# benchmarks without network access or an API bill
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.5"))
+LLM_FAKE_JITTER = float(os.getenv("LLM_FAKE_JITTER", "0.2"))
+LLM_FAKE_TOKEN_DELAY = float(os.getenv("LLM_FAKE_TOKEN_DELAY", "0.01"))
+LLM_FAKE_FAILURE_RATE = float(os.getenv("LLM_FAKE_FAILURE_RATE", "0"))
+
+# Upstream calls in flight across all tasks in this process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# How long a call may wait for a free slot before failing with a 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "5"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+LLM_RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# model is the task's default; routes are cheaper models for short inputs
+# (see APIs/modelRouting.py) and max_cost an optional per-call budget in USD
+Task = namedtuple(
+    "Task",
+    ["model", "timeout", "max_tokens", "concurrency", "routes", "max_cost"],
+    defaults=((), None),
+)
+Completion = namedtuple("Completion", ["text", "model", "usage"])
+
+# Output caps are several times the typical reply (a few hundred tokens for a
+# grade, two grades for the combined task) so that only runaway replies hit
+# them. A reply cut off at the cap is retried once with twice the cap and
+# fails after that, since every grading format ends with the grade.
+DEFAULT_TASKS = {
+    # One-line questions ("is a heap right here?") do not need the big model
+    "chat": Task("gpt-4", 60.0, 1000, 16, (Route("gpt-4o-mini", 60),)),
+    "generate_problem": Task("gpt-4o", 90.0, 2000, 8),
+    "evaluate_code": Task("gpt-4o", 60.0, 1500, 16),
+    "evaluate_speech": Task("gpt-4", 60.0, 1500, 16),
+    "evaluate_combined": Task("gpt-4o", 60.0, 3000, 16),
+}
+
+
+class TruncatedReply(Exception):
+    # The model stopped at max_tokens; the reply is incomplete
+    pass
+
+
+def task_from_env(name, default):
+    # e.g. LLM_EVALUATE_CODE_MODEL, LLM_EVALUATE_CODE_TIMEOUT,
+    # LLM_EVALUATE_CODE_MAX_TOKENS, LLM_EVALUATE_CODE_CONCURRENCY,
+    # LLM_EVALUATE_CODE_ROUTES, LLM_EVALUATE_CODE_MAX_COST
+    prefix = f"LLM_{name.upper()}_"
+    timeout = os.getenv(prefix + "TIMEOUT")
+    max_tokens = os.getenv(prefix + "MAX_TOKENS")
+    concurrency = os.getenv(prefix + "CONCURRENCY")
+    routes = os.getenv(prefix + "ROUTES")
+    max_cost = os.getenv(prefix + "MAX_COST")
+    return Task(
+        os.getenv(prefix + "MODEL", default.model),
+        float(timeout) if timeout else default.timeout,
+        int(max_tokens) if max_tokens else default.max_tokens,
+        int(concurrency) if concurrency else default.concurrency,
+        parse_routes(routes) if routes is not None else default.routes,
+        float(max_cost) if max_cost else default.max_cost,
+    )
+
+
+def is_rate_limit(error):
+    return isinstance(error, openai.error.RateLimitError)
+
+
+def is_timeout(error):
+    return isinstance(error, (TimeoutError, openai.error.Timeout))
+
+
+def is_upstream_failure(error):
+    # Malformed requests and long replies are not a sign the upstream is
+    # unhealthy
+    return not isinstance(error, (openai.error.InvalidRequestError, TruncatedReply))
+
+
+def retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text and code
+    return len(text) // 4 + 1
+
+
+def prompt_tokens(messages):
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+class OpenAIBackend:
+    def complete(self, model, messages, timeout, max_tokens):
+        response = openai.ChatCompletion.create(
+            model=model, messages=messages, request_timeout=timeout, **self._limits(max_tokens)
+        )
+        usage = dict(getattr(response, "usage", None) or {})
+        choice = response.choices[0]
+        return choice.message["content"].strip(), usage, choice.get("finish_reason")
+
+    def stream(self, model, messages, timeout, max_tokens):
+        upstream = openai.ChatCompletion.create(
+            model=model,
+            messages=messages,
+            request_timeout=timeout,
+            stream=True,
+            **self._limits(max_tokens),
+        )
+        try:
+            for chunk in upstream:
+                delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            close = getattr(upstream, "close", None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def _limits(max_tokens):
+        return {"max_tokens": max_tokens} if max_tokens else {}
+
+
+class FakeBackend:
+    # Replies are a pure function of the model and prompt, and so is the
+    # simulated latency, so repeated runs are comparable. Replies follow the
+    # formats the parsers expect so the whole request path is exercised.
+    def __init__(
+        self,
+        latency=LLM_FAKE_LATENCY,
+        jitter=LLM_FAKE_JITTER,
+        token_delay=LLM_FAKE_TOKEN_DELAY,
+        failure_rate=LLM_FAKE_FAILURE_RATE,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        # Share of calls that fail with a rate-limit error, to exercise retries
+        # and the circuit breaker
+        self.failure_rate = failure_rate
+
+    def complete(self, model, messages, timeout, max_tokens):
+        seed = self._seed(model, messages)
+        self._sleep(self._delay(seed), timeout)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise openai.error.RateLimitError("Fake rate limit")
+        text = self._reply(seed, messages, None)
+        finish_reason = "stop"
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text, finish_reason = text[: max_tokens * 4], "length"
+        usage = {
+            "prompt_tokens": prompt_tokens(messages),
+            "completion_tokens": estimate_tokens(text),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return text, usage, finish_reason
+
+    def stream(self, model, messages, timeout, max_tokens):
+        seed = self._seed(model, messages)
+        self._sleep(self._delay(seed), timeout)
+        for word in self._reply(seed, messages, max_tokens).split(" "):
+            yield word + " "
+            time.sleep(self.token_delay)
+
+    @staticmethod
+    def _seed(model, messages):
+        content = "\0".join([model] + [message["content"] for message in messages])
+        return int(hashlib.sha256(content.encode()).hexdigest()[:16], 16)
+
+    def _delay(self, seed):
+        return max(0.0, self.latency + random.Random(seed).uniform(-self.jitter, self.jitter))
+
+    @staticmethod
+    def _sleep(delay, timeout):
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake LLM call exceeded {timeout}s")
+        time.sleep(delay)
+
+    @staticmethod
+    def _reply(seed, messages, max_tokens):
+        prompt = messages[-1]["content"]
+        grade, speech_grade = seed % 10 + 1, seed // 10 % 10 + 1
+        if "Code Final Grade" in prompt:
+            text = (
+                f"Code Evaluation: Fake evaluation {seed % 1000}.\n"
+                "Code Feedback: Fake feedback.\n"
+                f"Code Final Grade: {grade}\n"
+                "Speech Evaluation: Fake speech evaluation.\n"
+                "Speech Feedback: Fake speech feedback.\n"
+                f"Speech Final Grade: {speech_grade}"
+            )
+        elif "Final Grade" in prompt:
+            text = (
+                f"Evaluation: Fake evaluation {seed % 1000}.\n"
+                "Feedback: Fake feedback.\n"
+                f"Final Grade: {grade}"
+            )
+        elif "coding problem tailored" in prompt:
+            text = (
+                f"Problem Description: Fake problem {seed % 100000}. Return the sum of a list.\n\n"
+                "Example 1:\nInput: [1, 2]\nOutput: 3\n\n"
+                "Example 2:\nInput: []\nOutput: 0\n\n"
+                "Constraints: 0 <= len(nums) <= 10^5\n\n"
+                "Function Signature: def solve(nums: list[int]) -> int:"
+            )
+        else:
+            text = "Think about which data structure gives you constant time lookups."
+        if max_tokens:
+            text = text[: max_tokens * 4]
+        return text
+
+
+# Identical requests only coalesce within one scope (the requesting user), so
+# a reply built from one user's prompt is never handed to another user
+_scope = ContextVar("llm_scope", default=None)
+
+
+@contextmanager
+def llm_scope(uid, fallback=None):
+    # uid also tags usage accounting; anonymous callers coalesce within the
+    # fallback scope (e.g. the client address) instead
+    token = _scope.set(uid or fallback)
+    try:
+        with usage_user(uid):
+            yield
+    finally:
+        _scope.reset(token)
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one upstream call: the first
+    # caller runs it and everyone else waits for its result or exception
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"calls": 0, "upstream_calls": 0, "saved_calls": 0}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats["upstream_calls"] += 1
+            else:
+                self._stats["saved_calls"] += 1
+
+        if not leader:
+            try:
+                return future.result(timeout)
+            except FutureTimeout:
+                # Same 504 the leader gets when its own deadline runs out
+                raise DeadlineExceeded("Request deadline exceeded while waiting for a shared call")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+def request_key(scope, task, model, config, messages):
+    content = "\0".join(
+        [str(scope), task, model, str(config.max_tokens)]
+        + [f"{message['role']}:{message['content']}" for message in messages]
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class LLMClient:
+    # Every model call goes through here: per-task limits and model routing,
+    # single-flight coalescing, a global and per-task concurrency cap, the
+    # request deadline, rate-limit retries and a circuit breaker per model.
+    def __init__(
+        self,
+        backend,
+        tasks,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        queue_timeout=LLM_QUEUE_TIMEOUT,
+        retries=LLM_RATE_LIMIT_RETRIES,
+        breaker_failures=LLM_BREAKER_FAILURES,
+        breaker_cooldown=LLM_BREAKER_COOLDOWN,
+        tracker=None,
+    ):
+        self.backend = backend
+        self.tasks = tasks
+        self.tracker = tracker or UsageTracker()
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.single_flight = SingleFlight()
+        self.limiter = ConcurrencyLimiter("LLM", max_concurrency)
+        self.task_limiters = {
+            name: ConcurrencyLimiter(name, task.concurrency) for name, task in tasks.items()
+        }
+        models = {task.model for task in tasks.values()}
+        models.update(route.model for task in tasks.values() for route in task.routes)
+        self.breakers = {
+            model: CircuitBreaker(model, breaker_failures, breaker_cooldown) for model in models
+        }
+        self.router = ModelRouter(
+            self.tracker.latency, lambda model: self.breakers[model].is_open()
+        )
+        self._lock = threading.Lock()
+        self._retried = 0
+        self._length_retries = 0
+
+    def call(self, task, messages, timeout=None):
+        config = self.tasks[task]
+        timeout = time_left(timeout or config.timeout)
+        model = self._route(task, config, messages, timeout)
+        key = request_key(_scope.get(), task, model, config, messages)
+
+        def upstream():
+            started = time.monotonic()
+            try:
+                with deadline(timeout), self._slot(task):
+                    text, usage = self._with_retries(model, config, messages)
+            except Exception:
+                self.tracker.record(task, model, None, time.monotonic() - started, ok=False)
+                raise
+            if not usage:
+                usage = {
+                    "prompt_tokens": prompt_tokens(messages),
+                    "completion_tokens": estimate_tokens(text),
+                }
+            self.tracker.record(task, model, usage, time.monotonic() - started)
+            return Completion(text, model, usage)
+
+        return self.single_flight.do(key, upstream, timeout)
+
+    def complete(self, task, messages, timeout=None):
+        return self.call(task, messages, timeout).text
+
+    def stream(self, task, messages, timeout=None):
+        # Fails fast (before any response is started) while the breaker is
+        # open; otherwise returns a generator of content deltas, and closing
+        # it closes the upstream request
+        config = self.tasks[task]
+        timeout = time_left(timeout or config.timeout)
+        model = self._route(task, config, messages, timeout)
+        self.breakers[model].check()
+        return self._stream(task, model, config, messages, timeout)
+
+    def stats(self):
+        with self._lock:
+            retried, length_retries = self._retried, self._length_retries
+        return {
+            "single_flight": self.single_flight.stats(),
+            "rate_limit_retries": retried,
+            "length_retries": length_retries,
+            "concurrency": {
+                "global": self.limiter.stats(),
+                **{name: limiter.stats() for name, limiter in self.task_limiters.items()},
+            },
+            "breakers": {model: breaker.stats() for model, breaker in self.breakers.items()},
+            "routes": self.router.stats(),
+        }
+
+    def _route(self, task, config, messages, timeout):
+        # Routing looks at the newest message only: for chat that is the
+        # user's question, for the evaluations the whole prompt
+        return self.router.route(
+            task,
+            config,
+            estimate_tokens(messages[-1]["content"]),
+            prompt_tokens(messages),
+            timeout,
+        )
+
+    @contextmanager
+    def _slot(self, task):
+        limiters = (self.limiter, self.task_limiters[task])
+        acquired = []
+        try:
+            for limiter in limiters:
+                limiter.acquire(time_left(self.queue_timeout))
+                acquired.append(limiter)
+            yield
+        finally:
+            for limiter in reversed(acquired):
+                limiter.release()
+
+    def _with_retries(self, model, config, messages):
+        breaker = self.breakers[model]
+        breaker.before_call()
+        attempt = 0
+        max_tokens = config.max_tokens
+        spent = {}
+        try:
+            while True:
+                try:
+                    text, usage, finish_reason = self.backend.complete(
+                        model, messages, time_left(), max_tokens
+                    )
+                    for name, tokens in spent.items():
+                        usage[name] = usage.get(name, 0) + tokens
+                    if finish_reason == "length":
+                        if not max_tokens or max_tokens != config.max_tokens:
+                            raise TruncatedReply(
+                                f"{model} reply was cut off at {max_tokens} tokens"
+                            )
+                        # The cut-off attempt is still paid for
+                        spent = usage
+                        max_tokens *= 2
+                        with self._lock:
+                            self._length_retries += 1
+                        continue
+                    result = text, usage
+                    break
+                except Exception as e:
+                    if not is_rate_limit(e) or attempt >= self.retries:
+                        raise
+                    delay = retry_after(e) or backoff_delay(attempt, LLM_RETRY_BASE, LLM_RETRY_CAP)
+                    remaining = time_left()
+                    if remaining is not None and delay >= remaining:
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self._retried += 1
+                    time.sleep(delay)
+        except Exception as e:
+            self._record_failure(breaker, e)
+            if is_rate_limit(e):
+                raise UpstreamUnavailable(
+                    f"{model} is rate limited", retry_after=retry_after(e) or 1
+                ) from e
+            if is_timeout(e):
+                raise DeadlineExceeded(f"{model} did not answer in time") from e
+            raise
+        breaker.record_success()
+        return result
+
+    def _stream(self, task, model, config, messages, timeout):
+        # Streamed responses carry no usage, so tokens are estimated
+        breaker = self.breakers[model]
+        started = time.monotonic()
+        deltas = []
+        failed = False
+        try:
+            with deadline(timeout), self._slot(task):
+                breaker.before_call()
+                try:
+                    for delta in self.backend.stream(
+                        model, messages, time_left(), config.max_tokens
+                    ):
+                        deltas.append(delta)
+                        yield delta
+                except Exception as e:
+                    failed = True
+                    self._record_failure(breaker, e)
+                    raise
+                finally:
+                    if not failed:
+                        breaker.record_success()
+        finally:
+            usage = {
+                "prompt_tokens": prompt_tokens(messages),
+                "completion_tokens": estimate_tokens("".join(deltas)) if deltas else 0,
+            }
+            self.tracker.record(task, model, usage, time.monotonic() - started, ok=not failed)
+
+    @staticmethod
+    def _record_failure(breaker, error):
+        if isinstance(error, UpstreamUnavailable):
+            # Our own deadline ran out; says nothing about upstream health
+            breaker.record_skipped()
+        elif is_upstream_failure(error):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+
+def make_backend(name):
+    if name == "fake":
+        return FakeBackend()
+    if name == "openai":
+        return OpenAIBackend()
+    raise ValueError(f"Unknown LLM backend '{name}'")
+
+
+llm = LLMClient(
+    make_backend(LLM_BACKEND),
+    {name: task_from_env(name, default) for name, default in DEFAULT_TASKS.items()},
+    tracker=UsageTracker(usage_writer.submit),
+)
@@ -0,0 +1,79 @@
+import logging
+import threading
+from collections import namedtuple
+
+from APIs.usage import estimate_cost
+
+# A cheaper or faster model for inputs of at most max_input_tokens
+Route = namedtuple("Route", ["model", "max_input_tokens"])
+
+
+def parse_routes(value):
+    # "gpt-4o-mini:60,gpt-4o:400" -> (Route("gpt-4o-mini", 60), Route("gpt-4o", 400))
+    routes = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, limit = item.partition(":")
+        routes.append(Route(model.strip(), int(limit) if limit else None))
+    return tuple(routes)
+
+
+class ModelRouter:
+    # Picks the model for one call. The task's routes are tried in order and
+    # the first one the new input fits is preferred, falling back to the
+    # task's own model. The preferred model is then skipped if its breaker is
+    # open, its observed p95 latency does not fit in the time left, or its
+    # worst-case cost is over the task's budget; the next candidate that fits
+    # is used instead, and if none does the preferred model is kept.
+    def __init__(self, latency, is_open):
+        self.latency = latency
+        self.is_open = is_open
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def route(self, task, config, input_tokens, prompt_tokens, budget):
+        candidates = [
+            route.model
+            for route in config.routes
+            if route.max_input_tokens is None or input_tokens <= route.max_input_tokens
+        ]
+        candidates.append(config.model)
+        # Models the input is too long for are only a last resort
+        fallbacks = [route.model for route in config.routes if route.model not in candidates]
+
+        preferred = model = candidates[0]
+        reason = "input size" if preferred != config.model else "default"
+        for candidate in dict.fromkeys(candidates + fallbacks):
+            skip = self._skip(candidate, config, prompt_tokens, budget)
+            if skip is None:
+                model = candidate
+                break
+            if candidate == preferred:
+                reason = f"{preferred} {skip}"
+
+        logging.info(
+            f"LLM route {task}: {model} ({reason}; {input_tokens} input tokens, "
+            f"{prompt_tokens} prompt tokens, {budget if budget is None else round(budget, 1)}s left)"
+        )
+        with self._lock:
+            counts = self._stats.setdefault(task, {})
+            counts[model] = counts.get(model, 0) + 1
+        return model
+
+    def _skip(self, model, config, prompt_tokens, budget):
+        if self.is_open(model):
+            return "breaker open"
+        p95 = self.latency(model, 0.95)
+        if budget is not None and p95 is not None and p95 > budget:
+            return f"p95 {p95:.1f}s over budget"
+        if config.max_cost is not None:
+            cost = estimate_cost(model, prompt_tokens, config.max_tokens or 0)
+            if cost > config.max_cost:
+                return f"cost ${cost:.4f} over budget"
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {task: dict(counts) for task, counts in self._stats.items()}
@@ -0,0 +1,308 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from APIs.generateProblems import generate_problem
+from database.models import UserHistory, problem_hash
+
+load_dotenv()
+
+PROBLEM_POOL = os.getenv("PROBLEM_POOL", "true").lower() in ("1", "true", "yes")
+# Ready problems kept per bucket
+PROBLEM_POOL_SIZE = int(os.getenv("PROBLEM_POOL_SIZE", "3"))
+PROBLEM_POOL_MAX_BUCKETS = int(os.getenv("PROBLEM_POOL_MAX_BUCKETS", "256"))
+# Only buckets requested this recently are refilled
+PROBLEM_POOL_HOT_WINDOW = float(os.getenv("PROBLEM_POOL_HOT_WINDOW", "3600"))
+PROBLEM_POOL_MAX_AGE = float(os.getenv("PROBLEM_POOL_MAX_AGE", "86400"))
+PROBLEM_POOL_WORKERS = int(os.getenv("PROBLEM_POOL_WORKERS", "2"))
+# A bucket is only refilled once it has had this many requests in the hot
+# window, so one-off profiles do not pay for problems nobody is served
+PROBLEM_POOL_MIN_REQUESTS = int(os.getenv("PROBLEM_POOL_MIN_REQUESTS", "3"))
+
+RATIO_STEP = 0.25
+
+# Free-text profile fields are reduced to these so similar users share a
+# bucket; the first keyword found wins
+LEVELS = (
+    ("beginner", ("beginner", "novice", "new to", "basic", "entry")),
+    ("advanced", ("advanced", "expert", "senior", "experienced")),
+    ("intermediate", ("intermediate", "some experience", "medium")),
+)
+GOAL_TOPICS = (
+    ("dynamic programming", ("dynamic programming", " dp", "memoization")),
+    ("graphs", ("graph", "bfs", "dfs", "shortest path")),
+    ("trees", ("tree", "bst", "trie")),
+    ("linked lists", ("linked list",)),
+    ("heaps", ("heap", "priority queue")),
+    ("stacks and queues", ("stack", "queue")),
+    ("hash maps", ("hash", "dictionary", "map")),
+    ("strings", ("string",)),
+    ("arrays", ("array", "two pointer", "sliding window")),
+    ("sorting and searching", ("sort", "binary search", "search")),
+    ("recursion and backtracking", ("recursion", "backtrack")),
+    ("greedy algorithms", ("greedy",)),
+    ("system design", ("system design",)),
+)
+COMPANIES = (
+    "google",
+    "meta",
+    "facebook",
+    "amazon",
+    "microsoft",
+    "apple",
+    "netflix",
+    "uber",
+    "airbnb",
+    "bloomberg",
+    "linkedin",
+    "stripe",
+    "oracle",
+    "salesforce",
+    "adobe",
+    "nvidia",
+    "tiktok",
+)
+GENERAL_GOAL = "general interview preparation"
+
+
+def ratio_band(ratio):
+    try:
+        return round(float(ratio) / RATIO_STEP) * RATIO_STEP
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def tag(text, limit=80):
+    text = " ".join(str(text or "").lower().split())
+    return "" if text == "n/a" else text[:limit]
+
+
+def category(text, categories):
+    text = f" {tag(text, None)}"
+    for name, keywords in categories:
+        if any(keyword in text for keyword in keywords):
+            return name
+    return None
+
+
+def interview_company(text):
+    # "N/A" for no interview, the company for a known one, and None for any
+    # other target, which is too specific to serve from a shared bucket
+    text = tag(text, None)
+    if not text:
+        return "N/A"
+    words = set(text.replace(",", " ").replace(".", " ").split())
+    for company in COMPANIES:
+        if company in words:
+            return "Meta" if company == "facebook" else company.title()
+    return None
+
+
+def bucket_profile(user, language):
+    # Users whose profiles land on the same key are served from the same
+    # queue; the key doubles as the generate_problem arguments for refills.
+    # Free text is reduced to a few categories so buckets are actually
+    # shared; None means the profile is not pooled and is always generated
+    # live.
+    interview = interview_company(user.upcoming_interview)
+    if interview is None:
+        return None
+    return (
+        category(user.user_level_description, LEVELS) or "N/A",
+        category(user.current_goal, GOAL_TOPICS) or GENERAL_GOAL,
+        ratio_band(user.easy_ratio),
+        ratio_band(user.medium_ratio),
+        ratio_band(user.hard_ratio),
+        ratio_band(user.overall_ratio),
+        tag(language, 20),
+        interview,
+    )
+
+
+class _Bucket:
+    __slots__ = ("ready", "last_requested", "requests", "refilling", "refill_requested_at")
+
+    def __init__(self):
+        self.ready = deque()  # (problem, hash, created_at)
+        self.last_requested = 0.0
+        self.requests = deque()  # request times within the hot window
+        self.refilling = False
+        self.refill_requested_at = 0.0
+
+
+class ProblemPool:
+    def __init__(
+        self,
+        generate,
+        seen_problems,
+        size=PROBLEM_POOL_SIZE,
+        max_buckets=PROBLEM_POOL_MAX_BUCKETS,
+        hot_window=PROBLEM_POOL_HOT_WINDOW,
+        max_age=PROBLEM_POOL_MAX_AGE,
+        workers=PROBLEM_POOL_WORKERS,
+        min_requests=PROBLEM_POOL_MIN_REQUESTS,
+        enabled=PROBLEM_POOL,
+    ):
+        self.generate = generate
+        self.seen_problems = seen_problems
+        self.size = size
+        self.max_buckets = max_buckets
+        self.hot_window = hot_window
+        self.max_age = max_age
+        self.workers = workers
+        self.min_requests = min_requests
+        self.enabled = enabled and size > 0
+
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # least recently requested first
+        self._executor = None
+        self._pid = None
+        self._stats = {
+            "requests": 0,
+            "unpooled": 0,
+            "hits": 0,
+            "misses": 0,
+            "skipped_seen": 0,
+            "expired": 0,
+            "generated": 0,
+            "refill_failures": 0,
+            "refills": 0,
+            "refill_lag_total": 0.0,
+            "refill_lag_max": 0.0,
+        }
+
+    def take(self, uid, profile, live_args):
+        # Returns (problem, served_from_pool). A miss generates from the
+        # user's exact profile (live_args) rather than the bucket's
+        if not self.enabled:
+            return self.generate(*live_args), False
+        if profile is None:
+            with self._lock:
+                self._stats["unpooled"] += 1
+            return self.generate(*live_args), False
+
+        with self._lock:
+            self._stats["requests"] += 1
+        problem = self._pop_unseen(uid, profile)
+        self._schedule_refill(profile)
+        if problem is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return problem, True
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return self.generate(*live_args), False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["buckets"] = len(self._buckets)
+            stats["ready"] = sum(len(bucket.ready) for bucket in self._buckets.values())
+            stats["refilling"] = sum(bucket.refilling for bucket in self._buckets.values())
+        stats["enabled"] = self.enabled
+        stats["min_requests"] = self.min_requests
+        stats["hit_rate"] = stats["hits"] / stats["requests"] if stats["requests"] else None
+        stats["refill_lag_avg"] = (
+            stats["refill_lag_total"] / stats["refills"] if stats["refills"] else None
+        )
+        del stats["refill_lag_total"]
+        return stats
+
+    def _bucket(self, profile):
+        # Caller holds the lock
+        bucket = self._buckets.get(profile)
+        if bucket is None:
+            bucket = self._buckets[profile] = _Bucket()
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(profile)
+        return bucket
+
+    def _pop_unseen(self, uid, profile):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(profile)
+            bucket.last_requested = now
+            bucket.requests.append(now)
+            while now - bucket.requests[0] > self.hot_window:
+                bucket.requests.popleft()
+            while bucket.ready and now - bucket.ready[0][2] > self.max_age:
+                bucket.ready.popleft()
+                self._stats["expired"] += 1
+            candidates = list(bucket.ready)
+        if not candidates:
+            return None
+
+        # Checked outside the lock; the user's history is a remote query
+        try:
+            seen = self.seen_problems(uid, [entry[1] for entry in candidates])
+        except Exception as e:
+            logging.warning(f"Problem pool could not check history: {str(e)}")
+            return None
+
+        with self._lock:
+            for entry in candidates:
+                if entry[1] in seen:
+                    self._stats["skipped_seen"] += 1
+                    continue
+                try:
+                    bucket.ready.remove(entry)
+                except ValueError:
+                    # Served to someone else in the meantime
+                    continue
+                return entry[0]
+        return None
+
+    def _schedule_refill(self, profile):
+        with self._lock:
+            bucket = self._buckets.get(profile)
+            if bucket is None or bucket.refilling or len(bucket.ready) >= self.size:
+                return
+            if len(bucket.requests) < self.min_requests:
+                return
+            bucket.refilling = True
+            bucket.refill_requested_at = time.monotonic()
+            executor = self._ensure_executor()
+        executor.submit(self._refill, profile, bucket)
+
+    def _ensure_executor(self):
+        # Caller holds the lock; created lazily so each forked worker gets its
+        # own threads
+        if self._executor is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="problem-pool"
+            )
+        return self._executor
+
+    def _needs_problem(self, profile, bucket):
+        with self._lock:
+            hot = time.monotonic() - bucket.last_requested <= self.hot_window
+            return self._buckets.get(profile) is bucket and hot and len(bucket.ready) < self.size
+
+    def _refill(self, profile, bucket):
+        try:
+            while self._needs_problem(profile, bucket):
+                problem = self.generate(*profile)
+                with self._lock:
+                    bucket.ready.append((problem, problem_hash(problem), time.monotonic()))
+                    self._stats["generated"] += 1
+        except Exception as e:
+            logging.error(f"Problem pool refill failed: {str(e)}")
+            with self._lock:
+                self._stats["refill_failures"] += 1
+        finally:
+            with self._lock:
+                bucket.refilling = False
+                lag = time.monotonic() - bucket.refill_requested_at
+                self._stats["refills"] += 1
+                self._stats["refill_lag_total"] += lag
+                self._stats["refill_lag_max"] = max(self._stats["refill_lag_max"], lag)
+
+
+problem_pool = ProblemPool(generate_problem, UserHistory.seen_problems)
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class UpstreamUnavailable(Exception):
+    # Raised instead of calling the model when it cannot answer in time;
+    # endpoints turn it into a 503 with Retry-After
+    status = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    status = 504
+
+
+# Absolute time.monotonic() by which the current HTTP request must finish
+_deadline = ContextVar("deadline", default=None)
+
+
+def set_deadline(seconds):
+    # For callers that cannot use a with block (request hooks); returns the
+    # token to pass to reset_deadline
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    return _deadline.set(new if current is None else min(current, new))
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    # Nested deadlines can only shorten the enclosing one
+    token = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left(limit=None):
+    # Seconds until the request deadline, capped at limit; raises once the
+    # deadline has passed so no new upstream work is started
+    current = _deadline.get()
+    if current is None:
+        return limit
+    remaining = current - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return remaining if limit is None else min(limit, remaining)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "rejected": 0, "in_use": 0, "max_in_use": 0}
+
+    def acquire(self, timeout):
+        if not self._semaphore.acquire(timeout=timeout):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise UpstreamUnavailable(f"Too many concurrent {self.name} requests", retry_after=1)
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+            self._stats["max_in_use"] = max(self._stats["max_in_use"], self._stats["in_use"])
+
+    def release(self):
+        with self._lock:
+            self._stats["in_use"] -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["limit"] = self.limit
+        return stats
+
+
+class CircuitBreaker:
+    # Closed: calls go through. After `failures` consecutive failures it opens
+    # and rejects calls for `cooldown` seconds, then lets a single trial call
+    # through (half-open); its outcome closes or re-opens the breaker.
+    def __init__(self, name, failures=5, cooldown=30.0):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def check(self):
+        # Raises while open without claiming the half-open trial call
+        with self._lock:
+            if self._state != "open":
+                return
+            wait = self._opened_at + self.cooldown - time.monotonic()
+            if wait <= 0:
+                return
+            self._stats["rejected"] += 1
+        raise UpstreamUnavailable(
+            f"{self.name} is unavailable, try again later", retry_after=max(1, round(wait))
+        )
+
+    def is_open(self):
+        with self._lock:
+            return self._state == "open" and self._opened_at + self.cooldown > time.monotonic()
+
+    def before_call(self):
+        with self._lock:
+            if self._state == "closed":
+                return
+            wait = self._opened_at + self.cooldown - time.monotonic()
+            if wait <= 0 and not self._trial_running:
+                self._state = "half-open"
+                self._trial_running = True
+                return
+            self._stats["rejected"] += 1
+        raise UpstreamUnavailable(
+            f"{self.name} is unavailable, try again later", retry_after=max(1, round(wait))
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._consecutive = 0
+            self._trial_running = False
+
+    def record_skipped(self):
+        # The call ended without a verdict on upstream health; a half-open
+        # breaker goes back to waiting for the next trial call
+        with self._lock:
+            self._trial_running = False
+            if self._state == "half-open":
+                self._state = "open"
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_running = False
+            if self._state == "half-open" or self._consecutive >= self.failures:
+                if self._state != "open":
+                    self._stats["opened"] += 1
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["state"] = self._state
+            stats["consecutive_failures"] = self._consecutive
+        return stats
+
+
+def backoff_delay(attempt, base, cap):
+    # Full jitter: spreads retries from many workers over the whole window
+    return random.uniform(0, min(cap, base * 2**attempt))
@@ -0,0 +1,141 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+# USD per 1K prompt and completion tokens; unknown models are costed at zero
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+# Latency samples kept per endpoint for the percentiles
+LATENCY_SAMPLES = 2000
+# Observed latencies are only used for routing once a model has this many
+MIN_LATENCY_SAMPLES = 20
+
+# Who and what a model call is made for. Set per HTTP request; calls made
+# outside a request (problem pool refills) are reported as "background".
+_endpoint = ContextVar("usage_endpoint", default=None)
+_user = ContextVar("usage_user", default=None)
+
+
+def set_endpoint(endpoint):
+    return _endpoint.set(endpoint)
+
+
+def reset_endpoint(token):
+    _endpoint.reset(token)
+
+
+@contextmanager
+def usage_user(uid):
+    token = _user.set(uid)
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Totals:
+    __slots__ = ("calls", "errors", "prompt_tokens", "completion_tokens", "cost", "latencies")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, ok, prompt_tokens, completion_tokens, cost, latency):
+        self.calls += 1
+        self.errors += not ok
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        self.latencies.append(latency)
+
+    def report(self):
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6),
+            "latency_p50": percentile(ordered, 0.5),
+            "latency_p95": percentile(ordered, 0.95),
+            "latency_p99": percentile(ordered, 0.99),
+        }
+
+
+class UsageTracker:
+    # Aggregates every model call in memory by endpoint and by model, and
+    # hands per-user totals to `persist` (a write-behind queue) for the daily
+    # usage columns
+    def __init__(self, persist=None):
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._models = {}
+
+    def record(self, task, model, usage, latency, ok=True):
+        endpoint = _endpoint.get() or "background"
+        uid = _user.get()
+        prompt_tokens = int(usage.get("prompt_tokens", 0)) if usage else 0
+        completion_tokens = int(usage.get("completion_tokens", 0)) if usage else 0
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+
+        with self._lock:
+            for totals, key in ((self._endpoints, endpoint), (self._models, model)):
+                if key not in totals:
+                    totals[key] = _Totals()
+                totals[key].add(ok, prompt_tokens, completion_tokens, cost, latency)
+
+        if uid and self.persist is not None:
+            try:
+                self.persist(
+                    (
+                        uid,
+                        datetime.now().strftime("%Y-%m-%d"),
+                        1,
+                        prompt_tokens,
+                        completion_tokens,
+                        cost,
+                    )
+                )
+            except Exception as e:
+                logging.warning(f"Failed to queue usage for {uid}: {str(e)}")
+
+    def latency(self, model, fraction):
+        # None until there are enough samples to say anything about the model
+        with self._lock:
+            totals = self._models.get(model)
+            if totals is None or len(totals.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(totals.latencies)
+        return percentile(ordered, fraction)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "endpoints": {key: totals.report() for key, totals in self._endpoints.items()},
+                "models": {key: totals.report() for key, totals in self._models.items()},
+            }
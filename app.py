@@ -1,57 +1,113 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from database.models import User, UserHistory
-import openai
+from database.models import (
+    User,
+    UserHistory,
+    UserStats,
+    DailyUsage,
+    HISTORY_FIELDS,
+    decode_history_cursor,
+    profile_cache,
+)
+from database.connection import pool
+from database.writer import history_writer, record_attempt, usage_writer
 import os
+import hmac
+import time
+from datetime import datetime
 import logging
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
 # Function Imports
-from APIs.getLeetCode import getLeetCodeInfo
-from APIs.generateProblems import generate_problem
-from APIs.evaluateResponse import evaluate_response, evaluate_speech, parse_evaluation
+from APIs.getLeetCode import getLeetCodeInfo, leetcode_client
+from APIs.chat import chat_messages, chat_stream_metrics, complete_chat, stream_ai_response
+from APIs.chatSessions import chat_sessions
+from APIs.llm import llm, llm_scope
+from APIs.upstream import UpstreamUnavailable, reset_deadline, set_deadline
+from APIs.usage import reset_endpoint, set_endpoint
+from APIs.problemPool import bucket_profile, problem_pool
+from APIs.evaluateResponse import (
+    EVALUATION_BATCH_LIMIT,
+    EVALUATION_BATCH_SAVE_EVERY,
+    EVALUATION_BATCH_SAVE_INTERVAL,
+    evaluate_batch,
+    evaluate_submission,
+)
+from APIs.evaluationCache import evaluation_cache
+from APIs.jobs import JOB_MAX_WAIT, jobs
 from messaging.emailing import send_email
 
 
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson serializes the slotted row dataclasses natively and several times
+    # faster than the stdlib encoder; without it Flask's default is used
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default).decode()
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-openai.api_key = os.getenv("OPEN_AI_API_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
 
 logging.basicConfig(level=logging.DEBUG)  # Set logging level to DEBUG
 
+MAX_HISTORY_PAGE = 100
+
 
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({"error": "Not found"}), 404
+def upstream_unavailable(error):
+    logging.warning(f"Model unavailable: {str(error)}")
+    response = jsonify({"message": str(error)})
+    response.status_code = error.status
+    if error.retry_after:
+        response.headers["Retry-After"] = str(int(error.retry_after))
+    return response
 
 
-def get_ai_response(prompt, problem):
-    system_prompt = f"""
-        You are an interview assistant. You are presenting a coding problem to the user and helping them through the problem. 
+@app.before_request
+def start_request_deadline():
+    # Clients may ask for a shorter deadline; every model call made for this
+    # request, including on the grading threads, stops waiting once it passes
+    try:
+        requested = float(request.headers.get("X-Request-Timeout", REQUEST_TIMEOUT))
+    except ValueError:
+        requested = REQUEST_TIMEOUT
+    g.deadline_token = set_deadline(max(0.1, min(requested, REQUEST_TIMEOUT)))
+    g.endpoint_token = set_endpoint(request.path)
 
-        You must not give away the solution directly. If the user asks for hints, provide only subtle hints that guide them in the right direction. Only give hints if the user provides context about their current progress or what they have tried so far. Also, don't answer more than what is needed. If a user asks something that can be answered in a yes or no response, return just yes or no
 
-        Make your answers short and concise. No more than 2 sentences
+@app.teardown_request
+def end_request_deadline(error=None):
+    token = g.pop("deadline_token", None)
+    if token is not None:
+        reset_deadline(token)
+    token = g.pop("endpoint_token", None)
+    if token is not None:
+        reset_endpoint(token)
 
-        Here is the problem: \n\n"
-        {problem}\n\n"
-        User: {prompt}\n\n"
-        Remember, do not give the solution directly.
-        """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    return response.choices[0].message["content"].strip()
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({"error": "Not found"}), 404
+
+
+def is_admin_request():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
 
 
 @app.route("/", methods=["GET", "HEAD"])
@@ -130,6 +186,44 @@ def log_user():
 
 
 #**************************** Problem generation / evaluation ****************************
+def wants_job(data):
+    # Opt-in async mode: answer 202 with a job id and run the work off the
+    # request thread, so a slow model call does not hold a worker. When job
+    # mode is off (see APIs.jobs) the request is answered synchronously.
+    if not jobs.enabled:
+        return False
+    return bool(data.get("async")) or "respond-async" in request.headers.get("Prefer", "")
+
+
+def submit_job(kind, fn, *args):
+    job = jobs.submit(kind, request.path, fn, *args)
+    location = f"/api/jobs/{job['id']}"
+    return (
+        jsonify({"job_id": job["id"], "status": job["status"], "location": location}),
+        202,
+        {"Location": location},
+    )
+
+
+def generate_problem_for(uid, user, language):
+    with llm_scope(uid):
+        problem, from_pool = problem_pool.take(
+            uid,
+            bucket_profile(user, language),
+            (
+                user.user_level_description,
+                user.current_goal,
+                user.easy_ratio,
+                user.medium_ratio,
+                user.hard_ratio,
+                user.overall_ratio,
+                language,
+                user.upcoming_interview,
+            ),
+        )
+    return {"problem": problem, "meta": {"pool": "hit" if from_pool else "miss"}}, 200
+
+
 @app.route("/api/generateProblem", methods=["POST"])
 def generate_problem_endpoint():
     try:
@@ -142,30 +236,80 @@ def generate_problem_endpoint():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        user_level_description = user[4]
-        overall_ratio = user[5]
-        easy_ratio = user[6]
-        medium_ratio = user[7]
-        hard_ratio = user[8]
-        current_goal = user[9]
-        upcoming_interview = user[10]
-
-        problem = generate_problem(
-            user_level_description,
-            current_goal,
-            easy_ratio,
-            medium_ratio,
-            hard_ratio,
-            overall_ratio,
-            language,
-            upcoming_interview,
-        )
-        return jsonify({"problem": problem})
+        if wants_job(data):
+            return submit_job("generateProblem", generate_problem_for, uid, user, language)
+        body, status = generate_problem_for(uid, user, language)
+        return jsonify(body), status
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         logging.error(f"Failed to generate problem: {str(e)}")
         return jsonify({"message": f"Failed to generate problem: {str(e)}"}), 500
 
 
+def evaluate_and_record(uid, problem, response, speech_input):
+    with llm_scope(uid):
+        code_result, speech_result, errors, meta = evaluate_submission(
+            problem, response, speech_input if speech_input != "N/A" else None
+        )
+    for error in errors.values():
+        logging.error(error)
+
+    speech_data = None
+    speech_evaluation2 = speech_feedback = final_speech_grade = None
+    if speech_result:
+        speech_evaluation2, speech_feedback, final_speech_grade = speech_result
+        final_speech_grade = int(final_speech_grade)
+        speech_data = {
+            "evaluation": speech_evaluation2,
+            "feedback": speech_feedback,
+            "final_grade": final_speech_grade,
+        }
+
+    if not code_result:
+        # Nothing can be saved without a code grade, but the speech
+        # result the user already waited for is still returned
+        return (
+            {
+                "message": f"Failed to evaluate response: {errors['code']}",
+                "code_evaluation": None,
+                "speech_evaluation": speech_data,
+                "errors": errors,
+                "meta": meta,
+            },
+            502,
+        )
+
+    code_evaluation2, feedback, final_grade = code_result
+    final_grade = int(final_grade)
+
+    record_attempt(
+        uid,
+        problem,
+        response,
+        code_evaluation2,
+        feedback,
+        final_grade,
+        speech_evaluation2,
+        speech_feedback,
+        final_speech_grade,
+    )
+
+    response_data = {
+        "code_evaluation": {
+            "evaluation": code_evaluation2,
+            "feedback": feedback,
+            "final_grade": final_grade,
+        },
+        "speech_evaluation": speech_data,
+        "meta": meta,
+    }
+    if errors:
+        response_data["errors"] = errors
+
+    return response_data, 200
+
+
 @app.route("/api/evaluateResponse", methods=["POST"])
 def evaluate_response_endpoint():
     try:
@@ -176,70 +320,264 @@ def evaluate_response_endpoint():
         speech_input = data.get("speechInput", "N/A")
 
         if problem and response and uid:
-            code_evaluation = evaluate_response(problem, response)
-            code_evaluation2, feedback, final_grade = parse_evaluation(code_evaluation)
-            final_grade = int(final_grade)
-
-            speech_evaluation2 = speech_feedback = final_speech_grade = None
-            if speech_input != "N/A":
-                speech_evaluation = evaluate_speech(problem, response, speech_input)
-                speech_evaluation2, speech_feedback, final_speech_grade = (
-                    parse_evaluation(speech_evaluation)
+            if wants_job(data):
+                return submit_job(
+                    "evaluateResponse", evaluate_and_record, uid, problem, response, speech_input
                 )
-                final_speech_grade = int(final_speech_grade)
+            body, status = evaluate_and_record(uid, problem, response, speech_input)
+            return jsonify(body), status
 
-            UserHistory.update_history(
-                uid,
+        return jsonify({"evaluation": "error"})
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        logging.error(f"Failed to evaluate response: {str(e)}")
+        return jsonify({"message": f"Failed to evaluate response: {str(e)}"}), 500
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    # ?wait=N long-polls for up to N seconds (capped) until the job finishes
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"message": "wait must be a number"}), 400
+
+    job = jobs.wait(job_id, wait) if wait else jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found or expired"}), 404
+    return jsonify(job)
+
+
+def batch_items(data):
+    # Returns (items, None) or (None, error message). Items may leave out the
+    # problem when the batch sends one for all of them.
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return None, "items must be a non-empty list"
+    if len(items) > EVALUATION_BATCH_LIMIT:
+        return None, f"At most {EVALUATION_BATCH_LIMIT} items per batch"
+
+    shared_problem = data.get("problem")
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None, f"Item {index} must be an object"
+        problem = item.get("problem") or shared_problem
+        if not (item.get("uid") and problem and item.get("userResponse")):
+            return None, f"Item {index} needs uid, problem and userResponse"
+        speech_input = item.get("speechInput", "N/A")
+        parsed.append(
+            (
+                item["uid"],
                 problem,
-                response,
-                code_evaluation2,
-                feedback,
-                final_grade,
-                speech_evaluation2,
-                speech_feedback,
-                final_speech_grade,
+                item["userResponse"],
+                speech_input if speech_input != "N/A" else None,
             )
+        )
+    return parsed, None
+
+
+def batch_result(result):
+    # Returns the NDJSON fields for one finished item and its history row,
+    # or None for the row when there is no code grade to save
+    if isinstance(result, UpstreamUnavailable):
+        line = {"error": str(result), "status": result.status, "retry_after": result.retry_after}
+        return line, None
+    if isinstance(result, Exception):
+        return {"error": f"Failed to evaluate response: {str(result)}"}, None
+
+    code_result, speech_result, errors, meta = result
+    line = {"code_evaluation": None, "speech_evaluation": None, "meta": meta}
+    if errors:
+        line["errors"] = errors
+    if speech_result:
+        evaluation, feedback, grade = speech_result
+        line["speech_evaluation"] = {
+            "evaluation": evaluation,
+            "feedback": feedback,
+            "final_grade": int(grade),
+        }
+    if not code_result:
+        line["error"] = f"Failed to evaluate response: {errors['code']}"
+        return line, None
+
+    evaluation, feedback, grade = code_result
+    line["code_evaluation"] = {
+        "evaluation": evaluation,
+        "feedback": feedback,
+        "final_grade": int(grade),
+    }
+    speech = line["speech_evaluation"] or {}
+    return line, (
+        evaluation,
+        feedback,
+        int(grade),
+        speech.get("evaluation"),
+        speech.get("feedback"),
+        speech.get("final_grade"),
+    )
 
-            UserHistory.update_daily_attempts(uid)
-
-            response_data = {
-                "code_evaluation": {
-                    "evaluation": code_evaluation2,
-                    "feedback": feedback,
-                    "final_grade": final_grade,
-                },
-                "speech_evaluation": (
-                    {
-                        "evaluation": speech_evaluation2,
-                        "feedback": speech_feedback,
-                        "final_grade": final_speech_grade,
-                    }
-                    if speech_input != "N/A"
-                    else None
-                ),
-            }
-
-            return jsonify(response_data)
 
-        return jsonify({"evaluation": "error"})
+@app.route("/api/evaluateBatch", methods=["POST"])
+def evaluate_batch_endpoint():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"message": "Expected a JSON object"}), 400
+        items, error = batch_items(data)
+        if error:
+            return jsonify({"message": error}), 400
+        ids = [item.get("id") for item in data["items"]]
+        batch = evaluate_batch(items, data.get("mode"), request.path)
     except Exception as e:
-        logging.error(f"Failed to evaluate response: {str(e)}")
-        return jsonify({"message": f"Failed to evaluate response: {str(e)}"}), 500
+        logging.error(f"Failed to start batch evaluation: {str(e)}")
+        return jsonify({"message": f"Failed to start batch evaluation: {str(e)}"}), 500
+
+    def results():
+        # One JSON line per item as it finishes (in completion order, so each
+        # line carries the item's index and id), then a summary line. Graded
+        # items are saved in chunks as they finish, so a worker killed mid-batch
+        # only loses the last chunk, and whatever is left is saved even if the
+        # client has gone away.
+        pending, graded, saved, failed, save_errors = [], 0, 0, 0, []
+        last_save = time.monotonic()
+
+        def save():
+            nonlocal pending, saved, last_save
+            rows, pending, last_save = pending, [], time.monotonic()
+            if not rows:
+                return
+            try:
+                UserHistory.record_attempts(rows)
+                saved += len(rows)
+            except Exception as e:
+                save_errors.append(str(e))
+                logging.error(f"Failed to save {len(rows)} batch evaluations: {str(e)}")
+
+        try:
+            for index, result in batch:
+                line, grades = batch_result(result)
+                if grades is None:
+                    failed += 1
+                else:
+                    graded += 1
+                    uid, problem, response, _ = items[index]
+                    pending.append(UserHistory.attempt_row(uid, problem, response, *grades))
+                yield app.json.dumps({"index": index, "id": ids[index], **line}) + "\n"
+                if len(pending) >= EVALUATION_BATCH_SAVE_EVERY or (
+                    pending and time.monotonic() - last_save >= EVALUATION_BATCH_SAVE_INTERVAL
+                ):
+                    save()
+        finally:
+            batch.close()
+            save()
+        summary = {"done": True, "graded": graded, "failed": failed, "saved": saved}
+        if save_errors:
+            summary["error"] = f"Failed to save evaluations: {save_errors[-1]}"
+        yield app.json.dumps(summary) + "\n"
+
+    return Response(
+        stream_with_context(results()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/chat/session", methods=["POST"])
+def start_chat_session():
+    try:
+        data = request.get_json()
+        uid = data.get("uid")
+        problem = data.get("problem")
+        if not uid or not problem:
+            return jsonify({"message": "Missing uid or problem"}), 400
+
+        session_id = chat_sessions.start(uid, problem, reset=bool(data.get("reset")))
+        return jsonify({"session_id": session_id}), 201
+    except Exception as e:
+        logging.error(f"Failed to start chat session: {str(e)}")
+        return jsonify({"message": f"Failed to start chat session: {str(e)}"}), 500
+
+
+def chat_context(data):
+    # Session clients send uid and sessionId and the problem lives server-side;
+    # older clients send the problem with every message
+    user_message = data.get("message")
+    session_id = data.get("sessionId")
+    if session_id:
+        return chat_sessions.messages(data.get("uid"), session_id, user_message)
+    return chat_messages(user_message, data.get("problem"))
 
 
 @app.route("/api/chat", methods=["POST"])
 def chat():
     try:
         data = request.get_json()
-        user_message = data.get("message")
-        problem = data.get("problem")
-        ai_response = get_ai_response(user_message, problem)
+        messages = chat_context(data)
+        if messages is None:
+            return jsonify({"message": "Chat session not found"}), 404
+
+        with llm_scope(data.get("uid"), request.remote_addr):
+            ai_response = complete_chat(messages)
+        if data.get("sessionId"):
+            chat_sessions.record(data.get("uid"), data["sessionId"], data.get("message"), ai_response)
         return jsonify({"ai_response": ai_response})
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
     except Exception as e:
         logging.error(f"Failed to get chat response: {str(e)}")
         return jsonify({"message": f"Failed to get chat response: {str(e)}"}), 500
 
 
+def sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {app.json.dumps(data)}\n\n"
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json()
+    if not data.get("message"):
+        return jsonify({"message": "Missing message"}), 400
+    messages = chat_context(data)
+    if messages is None:
+        return jsonify({"message": "Chat session not found"}), 404
+
+    uid = data.get("uid")
+    try:
+        with llm_scope(uid, request.remote_addr):
+            tokens = stream_ai_response(messages)
+    except UpstreamUnavailable as e:
+        return upstream_unavailable(e)
+
+    def events():
+        # If the client disconnects the server closes this generator, which
+        # closes stream_ai_response and the upstream request with it. The
+        # model call runs (and its usage is recorded) while the generator is
+        # iterated, so the user scope has to cover its whole lifetime.
+        reply = []
+        with llm_scope(uid, request.remote_addr):
+            try:
+                for token in tokens:
+                    reply.append(token)
+                    yield sse({"token": token})
+            except Exception as e:
+                yield sse({"message": f"Failed to get chat response: {str(e)}"}, "error")
+                return
+            finally:
+                tokens.close()
+        if data.get("sessionId"):
+            chat_sessions.record(data.get("uid"), data["sessionId"], data["message"], "".join(reply).strip())
+        yield sse({}, "done")
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 #**************************** DELETE USER ****************************
 @app.route("/api/deleteUser", methods=["POST"])
 def delete_user():
@@ -316,31 +654,11 @@ def send_email_endpoint():
 def get_user():
     try:
         uid = request.args.get("uid")
-        user = User.get_user_id(uid)
-        if not user:
+        dashboard = User.get_dashboard(uid)
+        if not dashboard:
             return jsonify({"error": "User not found"}), 404
 
-        code_grades = UserHistory.get_code_grades(uid)
-        speech_grades = UserHistory.get_speech_grades(uid)
-        attempts = UserHistory.count_history(uid)
-        lc_stats = UserHistory.get_leetcode_stats(uid)
-
-        return jsonify(
-            {
-                "user": {
-                    "username": user[2],
-                    "leetcode_username": user[3] if user[3] else None, 
-                    "level_description": user[4],
-                    "current_goal": user[9],
-                    "upcoming_interview": user[10],
-                    "signup_date": user[11],
-                },
-                "code_grades": code_grades,
-                "speech_grades": speech_grades,
-                "attempts": attempts,
-                "stats": lc_stats
-            }
-        )
+        return jsonify(dashboard)
     except Exception as e:
         logging.error(f"Failed to get user: {str(e)}")
         return jsonify({"message": f"Failed to get user: {str(e)}"}), 500
@@ -354,14 +672,157 @@ def get_user_history():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        history = UserHistory.get_user_history(uid)
+        limit = request.args.get("limit", type=int)
+        cursor = request.args.get("cursor")
+        fields = request.args.get("fields")
+        descending = request.args.get("order", "asc").lower() == "desc"
+        stream = request.args.get("stream", "").lower() in ("1", "true")
+
+        if fields:
+            fields = [field.strip() for field in fields.split(",") if field.strip()]
+            unknown = [field for field in fields if field not in HISTORY_FIELDS]
+            if unknown:
+                return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        if cursor:
+            try:
+                decode_history_cursor(cursor)
+            except ValueError:
+                return jsonify({"error": "Invalid cursor"}), 400
+
+        if stream:
+            return Response(
+                stream_with_context(stream_history(uid, fields, cursor, descending)),
+                mimetype="application/json",
+            )
+
+        if limit is None and not cursor:
+            history = UserHistory.get_user_history(uid, fields, descending)
+            return jsonify({"history": history})
+
+        limit = max(1, min(limit or MAX_HISTORY_PAGE, MAX_HISTORY_PAGE))
+        history, next_cursor = UserHistory.get_history_page(
+            uid, limit, cursor, fields, descending
+        )
 
-        return jsonify({"history": history})
+        return jsonify({"history": history, "next_cursor": next_cursor})
     except Exception as e:
         logging.error(f"Failed to get user history: {str(e)}")
         return jsonify({"message": f"Failed to get user history: {str(e)}"}), 500
 
 
+@app.route("/api/getUserStats", methods=["GET"])
+def get_user_stats():
+    try:
+        uid = request.args.get("uid")
+        stats = UserStats.get_stats(uid)
+        if stats is None:
+            return jsonify({"error": "User not found"}), 404
+
+        return jsonify({"stats": stats})
+    except Exception as e:
+        logging.error(f"Failed to get user stats: {str(e)}")
+        return jsonify({"message": f"Failed to get user stats: {str(e)}"}), 500
+
+
+def stream_history(uid, fields, cursor, descending):
+    yield '{"history": ['
+    separator = ""
+    try:
+        for entry in UserHistory.iter_user_history(uid, fields, cursor, descending):
+            yield separator + app.json.dumps(entry)
+            separator = ","
+    except Exception as e:
+        # Headers are already sent, so the truncated array is the error signal
+        logging.error(f"Failed while streaming user history: {str(e)}")
+        return
+    yield "]}"
+
+
+#**************************** Admin ****************************
+@app.route("/api/admin/poolStats", methods=["GET"])
+def pool_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"pool": pool.stats()})
+
+
+@app.route("/api/admin/writerStats", methods=["GET"])
+def writer_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"history_writer": history_writer.stats()})
+
+
+@app.route("/api/admin/cacheStats", methods=["GET"])
+def cache_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify(
+        {
+            "profile_cache": profile_cache.stats(),
+            "evaluation_cache": evaluation_cache.stats() if evaluation_cache else None,
+            "leetcode_cache": leetcode_client.cache.stats(),
+        }
+    )
+
+
+@app.route("/api/admin/chatStats", methods=["GET"])
+def chat_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"chat_stream": chat_stream_metrics.stats()})
+
+
+@app.route("/api/admin/llmStats", methods=["GET"])
+def llm_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"llm": llm.stats()})
+
+
+@app.route("/api/admin/jobStats", methods=["GET"])
+def job_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"jobs": jobs.stats()})
+
+
+@app.route("/api/admin/usage", methods=["GET"])
+def usage_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    # In-memory totals cover this process since it started; the per-user
+    # daily totals come from the database and cover every worker
+    date = request.args.get("date") or datetime.now().strftime("%Y-%m-%d")
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), MAX_HISTORY_PAGE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    response = llm.tracker.stats()
+    response["usage_writer"] = usage_writer.stats()
+    try:
+        response["top_users"] = {"date": date, "users": DailyUsage.top_users(date, limit)}
+    except Exception as e:
+        logging.error(f"Failed to load daily usage: {str(e)}")
+        response["top_users"] = None
+    return jsonify(response)
+
+
+@app.route("/api/admin/problemPoolStats", methods=["GET"])
+def problem_pool_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"problem_pool": problem_pool.stats()})
+
+
 if __name__ == "__main__":
     from database.initialization import initialize_database
 
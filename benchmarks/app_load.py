@@ -0,0 +1,71 @@
+# LOAD TEST: drive the Flask app in-process against the fake LLM backend
+#
+#   python -m benchmarks.app_load [--endpoint chat|evaluate] [--requests N] [--concurrency C]
+#
+# No network or API key is needed for the model calls: LLM_BACKEND defaults to
+# "fake" here, and LLM_FAKE_LATENCY / LLM_FAKE_JITTER shape its latency. The
+# evaluate endpoint also writes history, so it needs a reachable database and
+# an existing --uid.
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from APIs.evaluateResponse import a as SAMPLE_RESPONSE, p as SAMPLE_PROBLEM  # noqa: E402
+from app import app  # noqa: E402
+
+
+def payload(endpoint, i, uid):
+    if endpoint == "chat":
+        return "/api/chat", {"message": f"Is a heap the right idea? ({i})", "problem": SAMPLE_PROBLEM}
+    # Vary the response so the evaluation cache does not answer every request
+    return "/api/evaluateResponse", {
+        "problem": SAMPLE_PROBLEM,
+        "userResponse": f"{SAMPLE_RESPONSE}\nresult_{i} = None",
+        "uid": uid,
+        "speechInput": "I will count words and use a heap.",
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", choices=["chat", "evaluate"], default="chat")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--uid", default="load-test")
+    args = parser.parse_args()
+
+    def one(i):
+        path, body = payload(args.endpoint, i, args.uid)
+        started = time.perf_counter()
+        response = app.test_client().post(path, json=body)
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in results]
+    failures = sum(status >= 400 for _, status in results)
+    print(
+        f"{args.endpoint}: {args.requests} requests, concurrency {args.concurrency}, "
+        f"{failures} failed, {args.requests / elapsed:.1f} req/s"
+    )
+    print(
+        f"latency p50 {percentile(latencies, 0.5) * 1000:.0f}ms  "
+        f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms  "
+        f"p99 {percentile(latencies, 0.99) * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
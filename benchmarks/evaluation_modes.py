@@ -0,0 +1,81 @@
+# COMPARISON: separate vs combined code+speech evaluation
+#
+#   python -m benchmarks.evaluation_modes [--runs N] [--estimate]
+#
+# Live runs go through the configured LLM backend (OpenAI with OPEN_AI_API_KEY,
+# or LLM_BACKEND=fake offline) and report token usage and wall-clock latency
+# per mode. --estimate only sizes the prompts offline at roughly four
+# characters per token.
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from APIs.evaluateResponse import (
+    a as SAMPLE_RESPONSE,
+    p as SAMPLE_PROBLEM,
+    code_prompt,
+    combined_prompt,
+    speech_prompt,
+)
+from APIs.llm import llm
+
+SAMPLE_SPEECH = (
+    "So first I want to make sure I understand, we need the k most frequent words and ties go "
+    "alphabetically, right? I think a counter plus a heap works. I'll push negative counts so "
+    "the heap acts like a max heap, then pop k times. That is n log n, I could keep the heap at "
+    "size k to get n log k but I'll start simple."
+)
+
+
+def mode_requests():
+    return {
+        "separate": [
+            ("evaluate_code", code_prompt(SAMPLE_PROBLEM, SAMPLE_RESPONSE)),
+            ("evaluate_speech", speech_prompt(SAMPLE_PROBLEM, SAMPLE_RESPONSE, SAMPLE_SPEECH)),
+        ],
+        "combined": [
+            ("evaluate_combined", combined_prompt(SAMPLE_PROBLEM, SAMPLE_RESPONSE, SAMPLE_SPEECH)),
+        ],
+    }
+
+
+def call(task, prompt):
+    return llm.call(task, [{"role": "user", "content": prompt}]).usage
+
+
+def run_mode(requests, runs):
+    # Requests within a mode run concurrently, as evaluate_submission does
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        for _ in range(runs):
+            started = time.perf_counter()
+            usages = list(executor.map(lambda request: call(*request), requests))
+            totals["seconds"] += time.perf_counter() - started
+            for usage in usages:
+                totals["prompt_tokens"] += usage["prompt_tokens"]
+                totals["completion_tokens"] += usage["completion_tokens"]
+    return {key: value / runs for key, value in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--estimate", action="store_true")
+    args = parser.parse_args()
+
+    for mode, requests in mode_requests().items():
+        if args.estimate:
+            prompt_tokens = sum(len(prompt) // 4 for _, prompt in requests)
+            print(f"{mode:<9} {len(requests)} request(s)  ~{prompt_tokens} prompt tokens")
+            continue
+        result = run_mode(requests, args.runs)
+        print(
+            f"{mode:<9} {len(requests)} request(s)  "
+            f"{result['prompt_tokens']:.0f} prompt + {result['completion_tokens']:.0f} completion tokens  "
+            f"{result['seconds']:.2f}s wall clock (mean of {args.runs})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+
+class TTLCache:
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+class CacheManager(BaseManager):
+    pass
+
+
+class SharedCache:
+    # Talks to a TTLCache living in a separate process (see serve below) so all
+    # gunicorn workers on a host share one warm cache. Each name (profiles,
+    # jobs, chat sessions) gets its own TTLCache there, sized by the first
+    # client to ask for it, so one kind of entry cannot evict another. If the
+    # cache process is unreachable, lookups miss and writes are skipped rather
+    # than failing the request.
+    def __init__(self, address, authkey, name, max_size, ttl):
+        self.address = address
+        self.authkey = authkey
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = None
+        self._errors = 0
+
+    def get(self, key):
+        return self._call("get", key)
+
+    def set(self, key, value, ttl=None):
+        self._call("set", key, value, ttl)
+
+    def delete(self, key):
+        self._call("delete", key)
+
+    def clear(self):
+        self._call("clear")
+
+    def stats(self):
+        stats = self._call("stats") or {}
+        stats["errors"] = self._errors
+        return stats
+
+    def _call(self, method, *args):
+        try:
+            return getattr(self._connect(), method)(*args)
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+                self._cache = None
+            logging.warning(f"Shared cache at {self.address} unavailable: {str(e)}")
+            return None
+
+    def _connect(self):
+        with self._lock:
+            if self._cache is None:
+                manager = CacheManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._cache = manager.cache(self.name, self.max_size, self.ttl)
+            return self._cache
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def make_cache(backend, max_size, ttl, address=None, authkey=None, name="profiles"):
+    if backend == "shared":
+        if not authkey:
+            raise ValueError("The shared cache backend requires an authkey")
+        return SharedCache(parse_address(address), authkey.encode(), name, max_size, ttl)
+    return TTLCache(max_size, ttl)
+
+
+def serve(address, authkey):
+    if not authkey:
+        raise ValueError("The shared cache server requires an authkey")
+    caches = {}
+    lock = threading.Lock()
+
+    def cache(name, max_size, ttl):
+        with lock:
+            if name not in caches:
+                logging.info(f"Created shared cache {name} ({max_size} entries, {ttl}s)")
+                caches[name] = TTLCache(max_size, ttl)
+            return caches[name]
+
+    CacheManager.register("cache", callable=cache)
+    manager = CacheManager(address=address, authkey=authkey)
+    server = manager.get_server()
+    logging.info(f"Serving shared cache on {address[0]}:{address[1]}")
+    server.serve_forever()
+
+
+CacheManager.register("cache")
+
+
+if __name__ == "__main__":
+    from database.config import PROFILE_CACHE_ADDRESS, PROFILE_CACHE_AUTHKEY
+
+    logging.basicConfig(level=logging.INFO)
+    serve(parse_address(PROFILE_CACHE_ADDRESS), PROFILE_CACHE_AUTHKEY.encode())
@@ -6,3 +6,31 @@ load_dotenv()
 # Configure SQLiteCloud connection
 DATABASE_URL = os.getenv("SQLITECLOUD_CONN_STRING")
 DATABASE_NAME = os.getenv("SQLITECLOUD_DB_NAME")
+
+# Connection pool
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "10"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30"))
+
+# Write-behind for evaluation results
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+HISTORY_WRITE_BATCH_SIZE = int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "50"))
+HISTORY_WRITE_MAX_LATENCY = float(os.getenv("HISTORY_WRITE_MAX_LATENCY", "0.5"))
+HISTORY_WRITE_QUEUE_SIZE = int(os.getenv("HISTORY_WRITE_QUEUE_SIZE", "10000"))
+
+# Rows removed per committed statement when a user is deleted
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "500"))
+
+# Profile cache. "local" keeps one cache per worker; "shared" uses the cache
+# process started with `python -m database.cache`
+PROFILE_CACHE_BACKEND = os.getenv("PROFILE_CACHE_BACKEND", "local")
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "2048"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_CACHE_ADDRESS = os.getenv("PROFILE_CACHE_ADDRESS", "127.0.0.1:50055")
+PROFILE_CACHE_AUTHKEY = os.getenv("PROFILE_CACHE_AUTHKEY", "")
+
+# Store large evaluation/feedback columns as zlib-compressed BLOBs
+HISTORY_COMPRESSION = os.getenv("HISTORY_COMPRESSION", "false").lower() in ("1", "true", "yes")
+HISTORY_COMPRESSION_MIN_BYTES = int(os.getenv("HISTORY_COMPRESSION_MIN_BYTES", "256"))
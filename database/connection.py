@@ -1,5 +1,20 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import sqlitecloud
-from database.config import DATABASE_URL, DATABASE_NAME
+from database.config import (
+    DATABASE_URL,
+    DATABASE_NAME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_CHECKOUT_TIMEOUT,
+    DB_POOL_IDLE_TIMEOUT,
+    DB_POOL_HEALTHCHECK_AFTER,
+)
 
 
 def get_connection():
@@ -8,10 +23,199 @@ def get_connection():
     return conn
 
 
+class PoolTimeout(Exception):
+    pass
+
+
+# SQLite result codes a retry can get past: SQLITE_BUSY, SQLITE_LOCKED, SQLITE_IOERR
+TRANSIENT_SQLITE_CODES = (5, 6, 10)
+# SQLiteCloud's own codes for out of memory, internal and cluster errors
+TRANSIENT_CLOUD_CODES = (10000, 10003, 10006)
+
+
+def is_transient(error):
+    # Connection and server trouble may clear up on a retry; anything else (a
+    # constraint, a type mismatch, a malformed row) fails the same way again.
+    # Driver errors raised on the client side, such as a broken socket, carry
+    # errcode -1.
+    if isinstance(error, (PoolTimeout, OSError)):
+        return True
+    code = getattr(error, "errcode", getattr(error, "sqlite_errorcode", None))
+    if not isinstance(code, int):
+        return False
+    return code == -1 or code in TRANSIENT_CLOUD_CODES or code & 0xFF in TRANSIENT_SQLITE_CODES
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        factory,
+        max_size=DB_POOL_MAX_SIZE,
+        checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+        idle_timeout=DB_POOL_IDLE_TIMEOUT,
+        healthcheck_after=DB_POOL_HEALTHCHECK_AFTER,
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.healthcheck_after = healthcheck_after
+
+        self._cond = threading.Condition()
+        # (conn, last_used, suspect) tuples, most recently used on the right
+        self._idle = deque()
+        self._size = 0
+        self._pid = os.getpid()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "creations": 0,
+            "creation_failures": 0,
+            "healthcheck_failures": 0,
+            "evictions": 0,
+        }
+
+    def acquire(self):
+        self._check_fork()
+        deadline = time.monotonic() + self.checkout_timeout
+        waited_since = None
+
+        with self._cond:
+            self._stats["checkouts"] += 1
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.checkout_timeout}s"
+                    )
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+            if waited_since is not None:
+                self._stats["wait_time"] += time.monotonic() - waited_since
+
+        if entry is not None:
+            conn, last_used, suspect = entry
+            needs_check = suspect or time.monotonic() - last_used >= self.healthcheck_after
+            if not needs_check or self._is_healthy(conn):
+                return conn
+            with self._cond:
+                self._stats["healthcheck_failures"] += 1
+            self._close(conn)
+
+        # Either the pool had room or a stale connection was dropped; the slot is
+        # already reserved, so open a replacement for it
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._stats["creation_failures"] += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats["creations"] += 1
+        return conn
+
+    def release(self, conn, suspect=False):
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            self._idle.append((conn, time.monotonic(), suspect))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["max_size"] = self.max_size
+        return stats
+
+    def _evict_idle(self):
+        # Called with the lock held. The least recently used connections sit on
+        # the left, so stop at the first one that is still fresh.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] >= self.idle_timeout:
+            conn, _, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats["evictions"] += 1
+            self._close(conn)
+
+    def _check_fork(self):
+        # A forked worker must not reuse sockets that belong to its parent
+        if os.getpid() == self._pid:
+            return
+        with self._cond:
+            if os.getpid() != self._pid:
+                self._idle.clear()
+                self._size = 0
+                self._pid = os.getpid()
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logging.warning(f"Dropping unhealthy database connection: {str(e)}")
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+pool = ConnectionPool(get_connection)
+atexit.register(pool.close_all)
+
+
 class DatabaseConnection:
     def __enter__(self):
-        self.conn = get_connection()
+        self.conn = pool.acquire()
         return self.conn
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        # A failed block may have left the socket in a bad state, so have the
+        # pool ping it before it is handed out again
+        pool.release(self.conn, suspect=exc_type is not None)
+
+
+@contextmanager
+def transaction(conn):
+    # The SQLiteCloud driver treats commit()/rollback() as no-ops and runs every
+    # statement in autocommit mode, so transactions have to be spelled out
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
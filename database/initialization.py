@@ -1,6 +1,8 @@
 from database.models import User, UserHistory
+from database.migrations import run_migrations
 
 
 def initialize_database():
     User.initialize_table()
     UserHistory.initialize_table()
+    return run_migrations()
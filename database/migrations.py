@@ -0,0 +1,222 @@
+import logging
+from collections import namedtuple
+from datetime import datetime
+from database.connection import DatabaseConnection, transaction
+from database.models import UserStats, compress_text, problem_hash
+
+
+# A step is either a SQL string or a callable taking the connection. Steps must
+# be idempotent: several workers can boot at once and race to apply the same
+# version. Non-transactional migrations manage their own (batched) transactions.
+Migration = namedtuple(
+    "Migration", ["version", "description", "steps", "transactional"], defaults=[True]
+)
+
+
+def add_column(table, column, definition):
+    def step(conn):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return step
+
+
+def backfill_problem_hashes(conn, batch_size=200):
+    # Moves problem text out of userhistory and compresses the feedback columns,
+    # one committed batch at a time so the remote database is never locked for
+    # long. Rows already converted are skipped, so an interrupted run resumes.
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            """
+            SELECT id, code_evaluation, code_feedback, speech_evaluation, speech_feedback, user_question
+            FROM userhistory WHERE id > ? AND problem_hash IS NULL ORDER BY id LIMIT ?
+            """,
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return
+
+        problems = {problem_hash(row[5]): row[5] for row in rows}
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO problems (hash, body) VALUES (?, ?)",
+                list(problems.items()),
+            )
+            conn.executemany(
+                """
+                UPDATE userhistory SET problem_hash = ?, user_question = '', code_evaluation = ?,
+                    code_feedback = ?, speech_evaluation = ?, speech_feedback = ?
+                WHERE id = ?
+                """,
+                [
+                    (problem_hash(row[5]), *(compress_text(value) for value in row[1:5]), row[0])
+                    for row in rows
+                ],
+            )
+        last_id = rows[-1][0]
+        logging.info(f"Backfilled problem hashes up to userhistory id {last_id}")
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "index userhistory by user and date",
+        [
+            # Covers the per-user history scan and both grade series, and keeps
+            # each user's rows in saved_date order for keyset pagination
+            """
+            CREATE INDEX IF NOT EXISTS idx_userhistory_user_date
+            ON userhistory (user_id, saved_date, final_code_grade, final_speech_grade)
+            """,
+        ],
+    ),
+    Migration(
+        2,
+        "partial index for speech graded attempts",
+        [
+            # final_code_grade is NOT NULL, so code grade lookups are already
+            # served by idx_userhistory_user_date
+            """
+            CREATE INDEX IF NOT EXISTS idx_userhistory_speech_grades
+            ON userhistory (user_id, saved_date, final_speech_grade)
+            WHERE final_speech_grade IS NOT NULL
+            """,
+        ],
+    ),
+    Migration(
+        3,
+        "per-user stats aggregate",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY NOT NULL,
+                attempt_count INTEGER NOT NULL DEFAULT 0,
+                code_grade_count INTEGER NOT NULL DEFAULT 0,
+                code_grade_mean REAL NOT NULL DEFAULT 0.0,
+                code_grade_m2 REAL NOT NULL DEFAULT 0.0,
+                best_code_grade INTEGER,
+                speech_grade_count INTEGER NOT NULL DEFAULT 0,
+                speech_grade_mean REAL NOT NULL DEFAULT 0.0,
+                speech_grade_m2 REAL NOT NULL DEFAULT 0.0,
+                best_speech_grade INTEGER,
+                last_attempt_at TEXT,
+                last_attempt_date TEXT,
+                current_streak INTEGER NOT NULL DEFAULT 0,
+                longest_streak INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users (uid) ON DELETE CASCADE
+            )
+            """,
+            UserStats.rebuild_with,
+        ],
+    ),
+    Migration(
+        4,
+        "content-addressed problems",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS problems (
+                hash TEXT PRIMARY KEY NOT NULL,
+                body TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+            """,
+            add_column("userhistory", "problem_hash", "TEXT REFERENCES problems (hash)"),
+            """
+            CREATE INDEX IF NOT EXISTS idx_userhistory_user_problem
+            ON userhistory (user_id, problem_hash)
+            """,
+        ],
+    ),
+    Migration(
+        5,
+        "move problem text out of userhistory",
+        [backfill_problem_hashes],
+        transactional=False,
+    ),
+    Migration(
+        6,
+        "per-user daily model usage",
+        [
+            add_column("daily_attempts", "llm_calls", "INTEGER NOT NULL DEFAULT 0"),
+            add_column("daily_attempts", "prompt_tokens", "INTEGER NOT NULL DEFAULT 0"),
+            add_column("daily_attempts", "completion_tokens", "INTEGER NOT NULL DEFAULT 0"),
+            add_column("daily_attempts", "llm_cost", "REAL NOT NULL DEFAULT 0"),
+            """
+            CREATE INDEX IF NOT EXISTS idx_daily_attempts_date_cost
+            ON daily_attempts (date, llm_cost)
+            """,
+        ],
+    ),
+    Migration(
+        7,
+        "idempotent history writes",
+        [
+            # Set by attempt_row; rows written before this are NULL, which the
+            # unique index allows any number of
+            add_column("userhistory", "attempt_id", "TEXT"),
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_userhistory_attempt
+            ON userhistory (attempt_id)
+            """,
+        ],
+    ),
+]
+
+
+def get_schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] if row and row[0] is not None else 0
+
+
+def apply_steps(conn, steps):
+    for step in steps:
+        if callable(step):
+            step(conn)
+        else:
+            conn.execute(step)
+
+
+def record_version(conn, version, description):
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+        (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+def run_migrations():
+    with DatabaseConnection() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+            """
+        )
+        current = get_schema_version(conn)
+
+        for version, description, steps, transactional in MIGRATIONS:
+            if version <= current:
+                continue
+
+            logging.info(f"Applying migration {version}: {description}")
+            if transactional:
+                with transaction(conn):
+                    apply_steps(conn, steps)
+                    record_version(conn, version, description)
+            else:
+                apply_steps(conn, steps)
+                record_version(conn, version, description)
+            current = version
+
+    return current
+
+
+if __name__ == "__main__":
+    from database.initialization import initialize_database
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema is at version {initialize_database()}")
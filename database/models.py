@@ -1,5 +1,201 @@
-from datetime import datetime
-from database.connection import DatabaseConnection
+import base64
+import hashlib
+import json
+import uuid
+import zlib
+from dataclasses import dataclass, fields as dataclass_fields, make_dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from database.cache import make_cache
+from database.config import (
+    DELETE_BATCH_SIZE,
+    HISTORY_COMPRESSION,
+    HISTORY_COMPRESSION_MIN_BYTES,
+    PROFILE_CACHE_BACKEND,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    PROFILE_CACHE_ADDRESS,
+    PROFILE_CACHE_AUTHKEY,
+)
+from database.connection import DatabaseConnection, transaction
+
+
+# Profile rows keyed by uid. Every write to users invalidates the entry. With
+# the local backend each worker has its own cache, so the others keep serving
+# the old row until PROFILE_CACHE_TTL runs out; the shared backend has no such
+# window.
+profile_cache = make_cache(
+    PROFILE_CACHE_BACKEND,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    PROFILE_CACHE_ADDRESS,
+    PROFILE_CACHE_AUTHKEY,
+)
+
+# A token per uid that changes on every profile write. Kept apart from the
+# profiles so it neither skews their hit rate nor takes their slots.
+profile_generations = make_cache(
+    PROFILE_CACHE_BACKEND,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    PROFILE_CACHE_ADDRESS,
+    PROFILE_CACHE_AUTHKEY,
+    name="profile_generations",
+)
+
+
+def invalidate_profile(uid):
+    # A new generation first, so a read that started before the write does
+    # not put the old row back once it finishes (see User.get_user_id)
+    profile_generations.set(uid, uuid.uuid4().hex)
+    profile_cache.delete(f"profile:{uid}")
+
+# Selectable history fields and the SQL expression that produces each one.
+# Queries alias userhistory as h and LEFT JOIN problems as p; rows written
+# before problems were deduplicated still carry their own user_question.
+QUESTION_SQL = "COALESCE(p.body, h.user_question)"
+HISTORY_FIELDS = {
+    "user_question": QUESTION_SQL,
+    # First line of the problem, capped at 120 characters
+    "question_title": (
+        f"substr(ltrim({QUESTION_SQL}, char(32, 9, 10, 13)), 1, min(120, "
+        f"instr(ltrim({QUESTION_SQL}, char(32, 9, 10, 13)) || char(10), char(10)) - 1))"
+    ),
+    "user_response": "h.user_response",
+    "code_evaluation": 'COALESCE(h.code_evaluation, "N/A")',
+    "code_feedback": 'COALESCE(h.code_feedback, "N/A")',
+    "final_code_grade": 'COALESCE(h.final_code_grade, "N/A")',
+    "speech_evaluation": 'COALESCE(h.speech_evaluation, "N/A")',
+    "speech_feedback": 'COALESCE(h.speech_feedback, "N/A")',
+    "final_speech_grade": 'COALESCE(h.final_speech_grade, "N/A")',
+    "saved_date": 'COALESCE(h.saved_date, "N/A")',
+}
+HISTORY_FROM = "FROM userhistory h LEFT JOIN problems p ON p.hash = h.problem_hash"
+DEFAULT_HISTORY_FIELDS = (
+    "user_question",
+    "user_response",
+    "code_evaluation",
+    "code_feedback",
+    "final_code_grade",
+    "speech_evaluation",
+    "speech_feedback",
+    "final_speech_grade",
+    "saved_date",
+)
+
+
+# Typed rows built positionally from cursor rows. Slots keep them well under
+# half the size of the dicts they replace and make them faster to build. The
+# saving is memory only: orjson encodes dicts faster than dataclasses (see
+# benchmarks/history_rows.py).
+@dataclass(slots=True)
+class UserProfile:
+    uid: str
+    email: str
+    username: str
+    leetcode_username: str | None
+    user_level_description: str
+    overall_ratio: float | None
+    easy_ratio: float | None
+    medium_ratio: float | None
+    hard_ratio: float | None
+    current_goal: str | None
+    upcoming_interview: str | None
+    signup_date: str
+
+
+@dataclass(slots=True)
+class CodeGrade:
+    final_code_grade: int
+    saved_date: str
+
+
+@dataclass(slots=True)
+class SpeechGrade:
+    final_speech_grade: int
+    saved_date: str
+
+
+@dataclass(slots=True)
+class DailyAttempt:
+    saved_date: str
+    count: int
+
+
+@dataclass(slots=True)
+class DailyUsageTotal:
+    user_id: str
+    date: str
+    llm_calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    llm_cost: float
+
+
+def delete_batches(table, key, condition="1 = 1", params=(), batch_size=DELETE_BATCH_SIZE):
+    # Deletes the matching rows one bounded, committed statement at a time so
+    # the remote database is never locked for long; yields each batch's count
+    while True:
+        with DatabaseConnection() as conn:
+            conn.execute(
+                f"DELETE FROM {table} WHERE {key} IN "
+                f"(SELECT {key} FROM {table} WHERE {condition} LIMIT ?)",
+                tuple(params) + (batch_size,),
+            )
+            deleted = conn.execute("SELECT changes()").fetchone()[0]
+        yield deleted
+        if deleted < batch_size:
+            return
+
+
+def columns_of(row_type):
+    return ", ".join(field.name for field in dataclass_fields(row_type))
+
+
+PROFILE_COLUMNS = columns_of(UserProfile)
+
+
+@lru_cache(maxsize=None)
+def history_entry_type(fields):
+    # One slotted row class per projection, so a titles-and-grades page only
+    # carries the columns it asked for
+    return make_dataclass("HistoryEntry", [(field, object) for field in fields], slots=True)
+
+
+def problem_hash(problem):
+    return hashlib.sha256(problem.encode()).hexdigest()
+
+
+def compress_text(value):
+    # Large LLM feedback is stored as a zlib BLOB; short text stays as TEXT
+    if (
+        not HISTORY_COMPRESSION
+        or not isinstance(value, str)
+        or len(value) < HISTORY_COMPRESSION_MIN_BYTES
+    ):
+        return value
+    return zlib.compress(value.encode(), 6)
+
+
+def decode_text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return zlib.decompress(value).decode()
+    return value
+
+
+def encode_history_cursor(saved_date, row_id):
+    raw = json.dumps([saved_date, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_history_cursor(cursor):
+    try:
+        saved_date, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(saved_date, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return saved_date, row_id
 
 
 class User:
@@ -54,11 +250,81 @@ class User:
 
     @staticmethod
     def get_user_id(uid):
+        user = profile_cache.get(f"profile:{uid}")
+        if user is not None:
+            return user
         with DatabaseConnection() as conn:
-            cursor = conn.execute("SELECT * FROM users WHERE uid = ?", (uid,))
-            user = cursor.fetchone()
+            return User.load_profile(conn, uid)
+
+    @staticmethod
+    def load_profile(conn, uid):
+        # Reads the profile on the caller's connection and caches it
+        generation = profile_generations.get(uid)
+        cursor = conn.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE uid = ?", (uid,))
+        record = cursor.fetchone()
+        if not record:
+            return None
+        user = UserProfile(*record)
+        # Only cache the row if no write invalidated it while it was read. The
+        # second check catches an invalidation landing between the first and
+        # the set.
+        if profile_generations.get(uid) == generation:
+            profile_cache.set(f"profile:{uid}", user)
+            if profile_generations.get(uid) != generation:
+                profile_cache.delete(f"profile:{uid}")
         return user
 
+    @staticmethod
+    def get_dashboard(uid):
+        # A profile cache miss is read on the same connection as the rest
+        user = profile_cache.get(f"profile:{uid}")
+        with DatabaseConnection() as conn:
+            if user is None:
+                user = User.load_profile(conn, uid)
+                if not user:
+                    return None
+
+            # Both grade series and the daily attempts come back from one
+            # statement; the first column tells the rows apart
+            rows = conn.execute(
+                """
+                SELECT 'grade', final_code_grade, final_speech_grade, saved_date
+                FROM userhistory WHERE user_id = ?
+                    AND (final_code_grade IS NOT NULL OR final_speech_grade IS NOT NULL)
+                UNION ALL
+                SELECT 'attempt', count, NULL, date FROM daily_attempts WHERE user_id = ? AND count > 0
+                """,
+                (uid, uid),
+            ).fetchall()
+
+        code_grades, speech_grades, attempts = [], [], []
+        for kind, first, second, saved_date in rows:
+            if kind == "attempt":
+                attempts.append(DailyAttempt(saved_date, first))
+                continue
+            if first is not None:
+                code_grades.append(CodeGrade(first, saved_date))
+            if second is not None:
+                speech_grades.append(SpeechGrade(second, saved_date))
+
+        return {
+            "user": {
+                "username": user.username,
+                "leetcode_username": user.leetcode_username or None,
+                "level_description": user.user_level_description,
+                "current_goal": user.current_goal,
+                "upcoming_interview": user.upcoming_interview,
+                "signup_date": user.signup_date,
+            },
+            "code_grades": code_grades,
+            "speech_grades": speech_grades,
+            "attempts": attempts,
+            "stats": [
+                float(ratio or 0.0) * 100
+                for ratio in (user.overall_ratio, user.easy_ratio, user.medium_ratio, user.hard_ratio)
+            ],
+        }
+
     @staticmethod
     def get_email(username):
         with DatabaseConnection() as conn:
@@ -104,13 +370,23 @@ class User:
 
             # print(f"Update executed successfully for user {uid}")
             conn.commit()
+        invalidate_profile(uid)
 
     @staticmethod
-    def remove_user(uid):
+    def remove_user(uid, batch_size=DELETE_BATCH_SIZE):
+        # SQLiteCloud does not enforce ON DELETE CASCADE, so the user's rows are
+        # deleted first, in bounded batches, and the profile last; a run that
+        # fails part way can simply be repeated
+        for table, key in (
+            ("userhistory", "id"),
+            ("daily_attempts", "id"),
+            ("user_stats", "user_id"),
+        ):
+            for _ in delete_batches(table, key, "user_id = ?", (uid,), batch_size):
+                pass
         with DatabaseConnection() as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM users WHERE uid = ?", (uid,))
-            conn.commit()
+            conn.execute("DELETE FROM users WHERE uid = ?", (uid,))
+        invalidate_profile(uid)
 
     @staticmethod
     def update_goal(uid, new_goal):
@@ -120,6 +396,7 @@ class User:
                 """UPDATE users SET current_goal = ? WHERE uid = ?""", (new_goal, uid)
             )
             conn.commit()
+        invalidate_profile(uid)
 
     @staticmethod
     def update_interview(uid, new_interview):
@@ -129,6 +406,7 @@ class User:
                 """UPDATE users SET upcoming_interview = ? WHERE uid = ?""",
                 (new_interview, uid),
             )
+        invalidate_profile(uid)
 
     @staticmethod
     def update_level(uid, new_level):
@@ -138,6 +416,7 @@ class User:
                 """UPDATE users SET user_level_description = ? WHERE uid = ?""",
                 (new_level, uid),
             )
+        invalidate_profile(uid)
 
 
 class UserHistory:
@@ -177,7 +456,7 @@ class UserHistory:
             conn.commit()
 
     @staticmethod
-    def update_history(
+    def attempt_row(
         user_id,
         problem,
         response,
@@ -188,133 +467,386 @@ class UserHistory:
         speech_feedback=None,
         final_speech_grade=None,
     ):
-        save_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with DatabaseConnection() as conn:
-            conn.execute(
-                """INSERT INTO userhistory 
-                 (user_id, user_question, user_response, code_evaluation, code_feedback, final_code_grade, 
-                 speech_evaluation, speech_feedback, final_speech_grade, saved_date) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    user_id,
-                    problem,
-                    response,
-                    code_evaluation,
-                    code_feedback,
-                    final_code_grade,
-                    speech_evaluation,
-                    speech_feedback,
-                    final_speech_grade,
-                    save_date,
-                ),
-            )
-            conn.commit()
+        return (
+            user_id,
+            problem,
+            response,
+            code_evaluation,
+            code_feedback,
+            final_code_grade,
+            speech_evaluation,
+            speech_feedback,
+            final_speech_grade,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            # Lets a retried write skip rows that already landed
+            uuid.uuid4().hex,
+        )
 
     @staticmethod
-    def update_daily_attempts(user_id):
-        save_date = datetime.now().strftime("%Y-%m-%d")
-        with DatabaseConnection() as conn:
-            conn.execute(
-                """
-                INSERT INTO daily_attempts (user_id, date, count)
-                VALUES (?, ?, 1)
-                ON CONFLICT(user_id, date)
-                DO UPDATE SET count = count + 1
-                """,
-                (user_id, save_date),
+    def record_attempt(*args, **kwargs):
+        UserHistory.record_attempts([UserHistory.attempt_row(*args, **kwargs)])
+
+    @staticmethod
+    def record_attempts(rows):
+        # rows come from attempt_row. Writing the same rows again (say, a retry
+        # after a commit whose reply was lost) adds nothing: rows whose attempt
+        # id is already stored are skipped, and only new rows count towards
+        # daily_attempts and user_stats. Returns the number of new rows.
+        history_rows = {
+            row[10]: (
+                row[0],
+                "",
+                row[2],
+                compress_text(row[3]),
+                compress_text(row[4]),
+                row[5],
+                compress_text(row[6]),
+                compress_text(row[7]),
+                row[8],
+                row[9],
+                problem_hash(row[1]),
+                row[10],
             )
-            conn.commit()
+            for row in rows
+        }
+        placeholders = ", ".join("?" for _ in history_rows)
+
+        # executemany ships every statement to SQLiteCloud in a single request,
+        # so a batch costs a fixed number of round trips regardless of its size
+        with DatabaseConnection() as conn:
+            with transaction(conn):
+                stored = conn.execute(
+                    f"SELECT attempt_id FROM userhistory WHERE attempt_id IN ({placeholders})",
+                    tuple(history_rows),
+                ).fetchall()
+                stored = {record[0] for record in stored}
+                rows = [row for row in rows if row[10] not in stored]
+                if not rows:
+                    return 0
+
+                # The day is taken from each row's saved_date
+                daily_counts = {}
+                for row in rows:
+                    key = (row[0], row[9][:10])
+                    daily_counts[key] = daily_counts.get(key, 0) + 1
+
+                # Problem text is stored once in problems and referenced by hash
+                conn.executemany(
+                    "INSERT OR IGNORE INTO problems (hash, body) VALUES (?, ?)",
+                    list({problem_hash(row[1]): row[1] for row in rows}.items()),
+                )
+                conn.executemany(
+                    """INSERT OR IGNORE INTO userhistory
+                     (user_id, user_question, user_response, code_evaluation, code_feedback, final_code_grade,
+                     speech_evaluation, speech_feedback, final_speech_grade, saved_date, problem_hash, attempt_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    [history_rows[row[10]] for row in rows],
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO daily_attempts (user_id, date, count)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, date)
+                    DO UPDATE SET count = count + excluded.count
+                    """,
+                    [(user_id, date, count) for (user_id, date), count in daily_counts.items()],
+                )
+                conn.executemany(UserStats.UPSERT, UserStats.upsert_rows(rows))
+        return len(rows)
 
     @staticmethod
-    def get_user_history(uid):
+    def get_user_history(uid, fields=None, descending=False):
+        fields = tuple(fields or DEFAULT_HISTORY_FIELDS)
+        unknown = [field for field in fields if field not in HISTORY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown history fields: {', '.join(unknown)}")
+
+        columns = ", ".join(HISTORY_FIELDS[field] for field in fields)
+        order = "DESC" if descending else "ASC"
         with DatabaseConnection() as conn:
             cur = conn.cursor()
             history = cur.execute(
-                "SELECT user_question, user_response, "
-                'COALESCE(code_evaluation, "N/A"), COALESCE(code_feedback, "N/A"), '
-                'COALESCE(final_code_grade, "N/A"), COALESCE(speech_evaluation, "N/A"), '
-                'COALESCE(speech_feedback, "N/A"), COALESCE(final_speech_grade, "N/A"), '
-                'COALESCE(saved_date, "N/A") '
-                "FROM userhistory WHERE user_id = ?",
+                f"SELECT {columns} {HISTORY_FROM} WHERE h.user_id = ? "
+                f"ORDER BY h.saved_date {order}, h.id {order}",
                 (uid,),
             ).fetchall()
 
-        history_list = [
-            {
-                "user_question": record[0],
-                "user_response": record[1],
-                "code_evaluation": record[2],
-                "code_feedback": record[3],
-                "final_code_grade": record[4],
-                "speech_evaluation": record[5],
-                "speech_feedback": record[6],
-                "final_speech_grade": record[7],
-                "saved_date": record[8],
-            }
-            for record in history
-        ]
+        entry_type = history_entry_type(fields)
+        history_list = [entry_type(*map(decode_text, record)) for record in history]
 
         return history_list
 
     @staticmethod
-    def get_code_grades(uid):
+    def get_history_page(uid, limit, cursor=None, fields=None, descending=False):
+        fields = tuple(fields or DEFAULT_HISTORY_FIELDS)
+        unknown = [field for field in fields if field not in HISTORY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown history fields: {', '.join(unknown)}")
+
+        # saved_date and id always trail the projection so the next cursor can be built
+        columns = ", ".join(HISTORY_FIELDS[field] for field in fields)
+        query = f"SELECT {columns}, h.saved_date, h.id {HISTORY_FROM} WHERE h.user_id = ?"
+        params = (uid,)
+        if cursor:
+            query += " AND (h.saved_date, h.id) < (?, ?)" if descending else " AND (h.saved_date, h.id) > (?, ?)"
+            params += decode_history_cursor(cursor)
+        order = "DESC" if descending else "ASC"
+        query += f" ORDER BY h.saved_date {order}, h.id {order} LIMIT ?"
+        params += (limit + 1,)
+
         with DatabaseConnection() as conn:
-            cur = conn.cursor()
-            grades = cur.execute(
-                "SELECT final_code_grade, saved_date FROM userhistory WHERE user_id = ? AND final_code_grade IS NOT NULL",
-                (uid,),
-            ).fetchall()
+            cur = conn.execute(query, params)
+            records = cur.fetchmany(limit + 1)
 
-        grades_list = [
-            {"final_code_grade": grade[0], "saved_date": grade[1]} for grade in grades
-        ]
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_cursor = encode_history_cursor(records[-1][-2], records[-1][-1])
 
-        return grades_list
+        entry_type = history_entry_type(fields)
+        width = len(fields)
+        history_list = [entry_type(*map(decode_text, record[:width])) for record in records]
+
+        return history_list, next_cursor
+
+    @staticmethod
+    def iter_user_history(uid, fields=None, cursor=None, descending=False, batch_size=200):
+        # Walks the history one keyset page at a time so neither the remote
+        # result set nor the caller ever holds more than batch_size rows
+        while True:
+            history_list, cursor = UserHistory.get_history_page(
+                uid, batch_size, cursor, fields, descending
+            )
+            yield from history_list
+            if not cursor:
+                return
 
     @staticmethod
-    def get_speech_grades(uid):
+    def seen_problems(uid, hashes):
+        # Which of these problem hashes the user has already attempted
+        hashes = list(hashes)
+        if not hashes:
+            return set()
+        placeholders = ", ".join("?" for _ in hashes)
         with DatabaseConnection() as conn:
-            cur = conn.cursor()
-            grades = cur.execute(
-                "SELECT final_speech_grade, saved_date FROM userhistory WHERE user_id = ? AND final_speech_grade IS NOT NULL",
-                (uid,),
+            rows = conn.execute(
+                f"SELECT DISTINCT problem_hash FROM userhistory WHERE user_id = ? AND problem_hash IN ({placeholders})",
+                (uid, *hashes),
             ).fetchall()
 
-        grades_list = [
-            {"final_speech_grade": grade[0], "saved_date": grade[1]} for grade in grades
-        ]
+        return {row[0] for row in rows}
+
+
 
-        return grades_list
+class UserStats:
+    # Welford's online update for the grade mean and variance. SQLite evaluates
+    # every SET expression against the old row, so each one can refer to the
+    # previous count and mean directly.
+    UPSERT = """
+        INSERT INTO user_stats (
+            user_id, attempt_count,
+            code_grade_count, code_grade_mean, code_grade_m2, best_code_grade,
+            speech_grade_count, speech_grade_mean, speech_grade_m2, best_speech_grade,
+            last_attempt_at, last_attempt_date, current_streak, longest_streak
+        )
+        VALUES (?, 1, 1, ?, 0.0, ?, ?, ?, 0.0, ?, ?, ?, 1, 1)
+        ON CONFLICT(user_id) DO UPDATE SET
+            attempt_count = attempt_count + 1,
+            code_grade_count = code_grade_count + 1,
+            code_grade_mean = code_grade_mean
+                + (excluded.code_grade_mean - code_grade_mean) / (code_grade_count + 1),
+            code_grade_m2 = code_grade_m2
+                + (excluded.code_grade_mean - code_grade_mean)
+                * (excluded.code_grade_mean - code_grade_mean
+                   - (excluded.code_grade_mean - code_grade_mean) / (code_grade_count + 1)),
+            best_code_grade = MAX(COALESCE(best_code_grade, excluded.best_code_grade), excluded.best_code_grade),
+            speech_grade_count = speech_grade_count + excluded.speech_grade_count,
+            speech_grade_mean = CASE WHEN excluded.speech_grade_count = 0 THEN speech_grade_mean
+                ELSE speech_grade_mean
+                    + (excluded.speech_grade_mean - speech_grade_mean) / (speech_grade_count + 1) END,
+            speech_grade_m2 = CASE WHEN excluded.speech_grade_count = 0 THEN speech_grade_m2
+                ELSE speech_grade_m2
+                    + (excluded.speech_grade_mean - speech_grade_mean)
+                    * (excluded.speech_grade_mean - speech_grade_mean
+                       - (excluded.speech_grade_mean - speech_grade_mean) / (speech_grade_count + 1)) END,
+            best_speech_grade = CASE WHEN excluded.best_speech_grade IS NULL THEN best_speech_grade
+                ELSE MAX(COALESCE(best_speech_grade, excluded.best_speech_grade), excluded.best_speech_grade) END,
+            last_attempt_at = MAX(COALESCE(last_attempt_at, ''), excluded.last_attempt_at),
+            last_attempt_date = MAX(COALESCE(last_attempt_date, ''), excluded.last_attempt_date),
+            current_streak = CASE
+                WHEN excluded.last_attempt_date <= last_attempt_date THEN current_streak
+                WHEN last_attempt_date = date(excluded.last_attempt_date, '-1 day') THEN current_streak + 1
+                ELSE 1 END,
+            longest_streak = MAX(longest_streak, CASE
+                WHEN excluded.last_attempt_date <= last_attempt_date THEN current_streak
+                WHEN last_attempt_date = date(excluded.last_attempt_date, '-1 day') THEN current_streak + 1
+                ELSE 1 END)
+    """
+
+    # Streaks come from runs of consecutive days in daily_attempts: subtracting
+    # the row number from the day number gives every day in a run the same key
+    REBUILD = """
+        WITH days AS (
+            SELECT user_id, date,
+                julianday(date) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date) AS run
+            FROM daily_attempts WHERE count > 0 {daily_filter}
+        ), runs AS (
+            SELECT user_id, COUNT(*) AS length, MAX(date) AS last_date FROM days GROUP BY user_id, run
+        ), streaks AS (
+            SELECT user_id, MAX(length) AS longest_streak,
+                (SELECT r.length FROM runs r WHERE r.user_id = runs.user_id
+                 ORDER BY r.last_date DESC LIMIT 1) AS current_streak
+            FROM runs GROUP BY user_id
+        ), grades AS (
+            SELECT user_id, COUNT(*) AS attempt_count,
+                COUNT(final_code_grade) AS code_count, AVG(final_code_grade) AS code_mean,
+                SUM(final_code_grade * final_code_grade) AS code_sq, MAX(final_code_grade) AS code_best,
+                COUNT(final_speech_grade) AS speech_count, AVG(final_speech_grade) AS speech_mean,
+                SUM(final_speech_grade * final_speech_grade) AS speech_sq, MAX(final_speech_grade) AS speech_best,
+                MAX(saved_date) AS last_attempt_at
+            FROM userhistory {history_filter} GROUP BY user_id
+        )
+        INSERT INTO user_stats (
+            user_id, attempt_count,
+            code_grade_count, code_grade_mean, code_grade_m2, best_code_grade,
+            speech_grade_count, speech_grade_mean, speech_grade_m2, best_speech_grade,
+            last_attempt_at, last_attempt_date, current_streak, longest_streak
+        )
+        SELECT g.user_id, g.attempt_count,
+            g.code_count, COALESCE(g.code_mean, 0.0),
+            MAX(0.0, COALESCE(g.code_sq - g.code_count * g.code_mean * g.code_mean, 0.0)), g.code_best,
+            g.speech_count, COALESCE(g.speech_mean, 0.0),
+            MAX(0.0, COALESCE(g.speech_sq - g.speech_count * g.speech_mean * g.speech_mean, 0.0)), g.speech_best,
+            g.last_attempt_at, substr(g.last_attempt_at, 1, 10),
+            COALESCE(s.current_streak, 0), COALESCE(s.longest_streak, 0)
+        FROM grades g LEFT JOIN streaks s ON s.user_id = g.user_id
+    """
+
+    @staticmethod
+    def upsert_rows(rows):
+        # Parameters for UPSERT from attempt_row tuples
+        params = []
+        for row in rows:
+            code_grade, speech_grade, saved_at = row[5], row[8], row[9]
+            params.append(
+                (
+                    row[0],
+                    float(code_grade),
+                    code_grade,
+                    0 if speech_grade is None else 1,
+                    0.0 if speech_grade is None else float(speech_grade),
+                    speech_grade,
+                    saved_at,
+                    saved_at[:10],
+                )
+            )
+        return params
 
     @staticmethod
-    def count_history(uid):
+    def get_stats(uid):
         with DatabaseConnection() as conn:
-            cur = conn.cursor()
-            records = cur.execute(
-                "SELECT date, count FROM daily_attempts WHERE user_id = ?",
+            record = conn.execute(
+                """
+                SELECT u.uid, s.attempt_count,
+                    s.code_grade_count, s.code_grade_mean, s.code_grade_m2, s.best_code_grade,
+                    s.speech_grade_count, s.speech_grade_mean, s.speech_grade_m2, s.best_speech_grade,
+                    s.last_attempt_at, s.last_attempt_date, s.current_streak, s.longest_streak
+                FROM users u LEFT JOIN user_stats s ON s.user_id = u.uid
+                WHERE u.uid = ?
+                """,
                 (uid,),
-            ).fetchall()
+            ).fetchone()
+
+        if not record:
+            return None
 
-        attempts_list = [
-            {"saved_date": record[0], "count": record[1]} for record in records
-        ]
+        def grade_stats(count, mean, m2, best):
+            count = count or 0
+            return {
+                "count": count,
+                "mean": round(mean, 2) if count else None,
+                "variance": round(m2 / count, 2) if count else None,
+                "best": best,
+            }
+
+        # The stored streak is as of the last attempt; it is broken once a full
+        # day passes without one
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        last_date = record[11]
+        current_streak = record[12] if last_date and last_date >= yesterday else 0
+
+        return {
+            "attempts": record[1] or 0,
+            "code_grades": grade_stats(record[2], record[3], record[4], record[5]),
+            "speech_grades": grade_stats(record[6], record[7], record[8], record[9]),
+            "last_attempt_at": record[10],
+            "current_streak": current_streak,
+            "longest_streak": record[13] or 0,
+        }
+
+    @staticmethod
+    def rebuild_with(conn, uid=None):
+        if uid is None:
+            conn.execute("DELETE FROM user_stats")
+            conn.execute(UserStats.REBUILD.format(daily_filter="", history_filter=""))
+        else:
+            conn.execute("DELETE FROM user_stats WHERE user_id = ?", (uid,))
+            conn.execute(
+                UserStats.REBUILD.format(
+                    daily_filter="AND user_id = ?", history_filter="WHERE user_id = ?"
+                ),
+                (uid, uid),
+            )
 
-        return attempts_list
-    
-    
     @staticmethod
-    def get_leetcode_stats(uid):
+    def rebuild(uid=None):
         with DatabaseConnection() as conn:
-            cur = conn.cursor()
-            lc_ratios = cur.execute(
-                "SELECT overall_ratio, easy_ratio, medium_ratio, hard_ratio FROM users WHERE uid = ?",
-                (uid,),
-            ).fetchone()  
+            with transaction(conn):
+                UserStats.rebuild_with(conn, uid)
 
-        if lc_ratios:
-            lc_stats = [float(ratio) * 100 for ratio in lc_ratios] 
-        else:
-            lc_stats = [0.0, 0.0, 0.0, 0.0] 
 
-        return lc_stats
+class DailyUsage:
+    # Model usage is kept on the user's daily_attempts row. Usage can arrive on
+    # a day without a finished attempt, so those rows have count = 0 and every
+    # attempt query filters on count > 0.
+    UPSERT = """
+        INSERT INTO daily_attempts
+            (user_id, date, count, llm_calls, prompt_tokens, completion_tokens, llm_cost)
+        VALUES (?, ?, 0, ?, ?, ?, ?)
+        ON CONFLICT(user_id, date) DO UPDATE SET
+            llm_calls = llm_calls + excluded.llm_calls,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens,
+            llm_cost = llm_cost + excluded.llm_cost
+    """
+
+    @staticmethod
+    def record(rows):
+        # rows are (user_id, date, calls, prompt_tokens, completion_tokens, cost);
+        # rows for the same user and day are summed before writing
+        totals = {}
+        for user_id, date, *values in rows:
+            current = totals.get((user_id, date), (0, 0, 0, 0.0))
+            totals[(user_id, date)] = tuple(a + b for a, b in zip(current, values))
+
+        # One transaction, so a batch the writer splits after a bad row was
+        # not partly applied
+        with DatabaseConnection() as conn:
+            with transaction(conn):
+                conn.executemany(
+                    DailyUsage.UPSERT,
+                    [(user_id, date, *values) for (user_id, date), values in totals.items()],
+                )
+
+    @staticmethod
+    def top_users(date, limit=20):
+        with DatabaseConnection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {columns_of(DailyUsageTotal)} FROM daily_attempts
+                WHERE date = ? AND llm_calls > 0 ORDER BY llm_cost DESC LIMIT ?
+                """,
+                (date, limit),
+            ).fetchall()
 
+        return [DailyUsageTotal(*row) for row in rows]
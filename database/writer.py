@@ -0,0 +1,244 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from database.config import (
+    HISTORY_WRITE_BEHIND,
+    HISTORY_WRITE_BATCH_SIZE,
+    HISTORY_WRITE_MAX_LATENCY,
+    HISTORY_WRITE_QUEUE_SIZE,
+)
+from database.connection import is_transient
+from database.models import DailyUsage, UserHistory
+
+
+_STOP = object()
+# How often rows held back by a transient error are tried again when no new
+# batch comes along
+HELD_RETRY_INTERVAL = 5.0
+
+
+class HistoryWriter:
+    # Writes rows in the background in batches. A batch that fails on a bad
+    # row is split until that row is isolated, and the row is rejected (logged
+    # and counted) so it cannot block the rest. Rows that still fail with a
+    # transient error after the retries are held and written again later, so
+    # flush must be idempotent. While rows are held, submit writes the
+    # caller's own row synchronously, so the caller sees an error instead of
+    # a success for a row that may never be written.
+    def __init__(
+        self,
+        flush,
+        batch_size=HISTORY_WRITE_BATCH_SIZE,
+        max_latency=HISTORY_WRITE_MAX_LATENCY,
+        queue_size=HISTORY_WRITE_QUEUE_SIZE,
+        retries=3,
+        name="history-writer",
+    ):
+        self.flush = flush
+        self.name = name
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.retries = retries
+
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._failed = []
+        self._last_error = None
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "sync_fallbacks": 0,
+            "max_flush_seconds": 0.0,
+        }
+
+    def submit(self, row):
+        with self._lock:
+            self._stats["submitted"] += 1
+            failing = bool(self._failed)
+        if self._closed or failing:
+            self._write_now([row])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=self.max_latency)
+        except queue.Full:
+            # The writer is falling behind; apply backpressure to this request
+            # instead of growing the queue without bound
+            self._write_now([row])
+
+    def close(self, timeout=30):
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        # One last try for held rows; a failure is raised rather than losing
+        # them quietly at exit
+        with self._lock:
+            held, self._failed = self._failed, []
+        held = self._write(held)
+        if held:
+            raise RuntimeError(
+                f"{self.name}: {len(held)} rows could not be written: {self._last_error}"
+            )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["held"] = len(self._failed)
+            stats["last_error"] = self._last_error
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker gets its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=HELD_RETRY_INTERVAL if self._failed else None)
+            except queue.Empty:
+                self._write_batch([])
+                continue
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            stopping = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._write_batch(batch)
+            if stopping:
+                self._drain()
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        with self._lock:
+            held, self._failed = self._failed, []
+        started = time.monotonic()
+        self._hold(self._write(held + batch))
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], elapsed)
+
+    def _write(self, rows):
+        # Returns the rows held back by a transient error
+        if not rows:
+            return []
+        for attempt in range(self.retries + 1):
+            try:
+                self.flush(rows)
+            except Exception as e:
+                error = e
+                if not is_transient(e) or attempt == self.retries:
+                    break
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(0.2 * 2**attempt)
+            else:
+                with self._lock:
+                    self._stats["written"] += len(rows)
+                return []
+
+        with self._lock:
+            self._last_error = str(error)
+        if is_transient(error):
+            logging.error(
+                f"{self.name}: holding {len(rows)} rows after {attempt + 1} attempts: {str(error)}"
+            )
+            return rows
+        if len(rows) == 1:
+            logging.error(f"{self.name}: rejected row {rows[0]!r:.200}: {str(error)}")
+            with self._lock:
+                self._stats["rejected"] += 1
+            return []
+        middle = len(rows) // 2
+        return self._write(rows[:middle]) + self._write(rows[middle:])
+
+    def _hold(self, rows):
+        if not rows:
+            return
+        with self._lock:
+            self._failed = rows + self._failed
+            # Bounded like the queue; beyond that the oldest rows are lost
+            overflow = len(self._failed) - self._queue.maxsize if self._queue.maxsize else 0
+            if overflow > 0:
+                del self._failed[:overflow]
+                self._stats["dropped"] += overflow
+        if overflow > 0:
+            logging.error(f"{self.name}: dropped {overflow} held rows")
+
+    def _write_now(self, rows):
+        # Only the caller's rows, so it never sees an error for someone else's
+        with self._lock:
+            self._stats["sync_fallbacks"] += 1
+        self.flush(rows)
+        with self._lock:
+            self._stats["written"] += len(rows)
+
+
+history_writer = HistoryWriter(UserHistory.record_attempts)
+atexit.register(history_writer.close)
+
+# Model usage is always written behind; one row per model call would
+# otherwise add a database round trip to every LLM request. DailyUsage.record
+# is not idempotent, so a retried batch whose commit did land is counted
+# twice; that is tolerated for usage totals.
+usage_writer = HistoryWriter(DailyUsage.record, name="usage-writer")
+atexit.register(usage_writer.close)
+
+
+def record_attempt(*args, **kwargs):
+    row = UserHistory.attempt_row(*args, **kwargs)
+    if HISTORY_WRITE_BEHIND:
+        history_writer.submit(row)
+    else:
+        UserHistory.record_attempts([row])
@@ -0,0 +1,231 @@
+# ADMIN CLI FOR USER AND HISTORY MAINTENANCE
+#
+#   python db_admin.py users
+#   python db_admin.py export history --format csv --out history.csv [--uid UID]
+#   python db_admin.py delete-users UID [UID ...] | --file uids.txt
+#   python db_admin.py clear {users,history}
+#   python db_admin.py gc-problems
+#   python db_admin.py rebuild-stats [UID]
+#
+# Every command walks tables in keyset order, one bounded batch per query, and
+# deletes in small committed batches so the remote database is never scanned
+# into memory or locked for long.
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+from database.connection import DatabaseConnection
+from database.models import (
+    HISTORY_FIELDS,
+    HISTORY_FROM,
+    PROFILE_COLUMNS,
+    User,
+    UserStats,
+    decode_text,
+    delete_batches,
+    profile_cache,
+)
+
+
+BATCH_SIZE = 500
+USER_FIELDS = PROFILE_COLUMNS.split(", ")
+HISTORY_EXPORT_FIELDS = ["id", "user_id"] + [
+    field for field in HISTORY_FIELDS if field != "question_title"
+]
+
+
+class Progress:
+    def __init__(self, label, stream=sys.stderr):
+        self.label = label
+        self.stream = stream
+        self.count = 0
+        self.started = time.monotonic()
+        self._last_draw = 0.0
+
+    def advance(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now - self._last_draw >= 0.2:
+            self._last_draw = now
+            self._draw()
+
+    def done(self):
+        self._draw()
+        self.stream.write("\n")
+        self.stream.flush()
+
+    def _draw(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        self.stream.write(
+            f"\r{self.label}: {self.count} rows ({self.count / elapsed:.0f}/s, {elapsed:.1f}s)"
+        )
+        self.stream.flush()
+
+
+def stream_rows(columns, source, key, start, where="", params=(), batch_size=BATCH_SIZE):
+    # Yields rows ordered by key; the key must be the last selected column
+    last = start
+    while True:
+        with DatabaseConnection() as conn:
+            cur = conn.execute(
+                f"SELECT {columns}, {key} {source} WHERE {key} > ? {where} ORDER BY {key} LIMIT ?",
+                (last,) + tuple(params) + (batch_size,),
+            )
+            rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield row[:-1]
+        last = rows[-1][-1]
+        if len(rows) < batch_size:
+            return
+
+
+def stream_users(batch_size=BATCH_SIZE):
+    for row in stream_rows(PROFILE_COLUMNS, "FROM users", "uid", "", batch_size=batch_size):
+        yield dict(zip(USER_FIELDS, row))
+
+
+def stream_history(uid=None, batch_size=BATCH_SIZE):
+    columns = "h.id, h.user_id, " + ", ".join(
+        HISTORY_FIELDS[field] for field in HISTORY_EXPORT_FIELDS[2:]
+    )
+    where, params = ("AND h.user_id = ?", (uid,)) if uid else ("", ())
+    for row in stream_rows(columns, HISTORY_FROM, "h.id", 0, where, params, batch_size):
+        yield dict(zip(HISTORY_EXPORT_FIELDS, map(decode_text, row)))
+
+
+def display_users(args):
+    progress = Progress("users")
+    for user in stream_users(args.batch_size):
+        print(", ".join(f"{field}: {user[field]}" for field in USER_FIELDS))
+        progress.advance()
+    progress.done()
+
+
+def export(args):
+    if args.table == "users":
+        rows, fields = stream_users(args.batch_size), USER_FIELDS
+    else:
+        rows, fields = stream_history(args.uid, args.batch_size), HISTORY_EXPORT_FIELDS
+
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    progress = Progress(f"export {args.table}")
+    try:
+        if args.format == "csv":
+            writer = csv.DictWriter(out, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                progress.advance()
+        else:
+            for row in rows:
+                out.write(json.dumps(row) + "\n")
+                progress.advance()
+    finally:
+        progress.done()
+        if out is not sys.stdout:
+            out.close()
+
+
+def delete_users(uids, batch_size=BATCH_SIZE):
+    # Same path as /api/deleteUser: each user's history, attempts and stats go
+    # in bounded batches, then the profile
+    progress = Progress("delete users")
+    for uid in uids:
+        User.remove_user(uid, batch_size)
+        progress.advance()
+    progress.done()
+
+
+def delete_in_batches(table, key, condition="1 = 1", params=(), batch_size=BATCH_SIZE):
+    progress = Progress(f"clear {table}")
+    for deleted in delete_batches(table, key, condition, params, batch_size):
+        progress.advance(deleted)
+    progress.done()
+
+
+def clear(args):
+    if not args.yes:
+        print(f"Refusing to clear '{args.table}' without --yes")
+        return 1
+    if args.table == "users":
+        for table, key in (
+            ("userhistory", "id"),
+            ("daily_attempts", "id"),
+            ("user_stats", "user_id"),
+            ("users", "uid"),
+        ):
+            delete_in_batches(table, key, batch_size=args.batch_size)
+        profile_cache.clear()
+    else:
+        delete_in_batches("userhistory", "id", batch_size=args.batch_size)
+        UserStats.rebuild()
+
+
+def gc_problems(args):
+    delete_in_batches(
+        "problems",
+        "hash",
+        "NOT EXISTS (SELECT 1 FROM userhistory h WHERE h.problem_hash = problems.hash)",
+        batch_size=args.batch_size,
+    )
+
+
+def delete_users_command(args):
+    uids = list(args.uids)
+    if args.file:
+        with open(args.file) as f:
+            uids.extend(line.strip() for line in f if line.strip())
+    if not uids:
+        print("No uids given")
+        return 1
+    delete_users(uids, args.batch_size)
+
+
+def rebuild_stats(args):
+    UserStats.rebuild(args.uid)
+    print(f"Rebuilt stats for {args.uid if args.uid else 'all users'}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="User and history maintenance")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("users", help="print every user").set_defaults(func=display_users)
+
+    export_parser = commands.add_parser("export", help="export users or history")
+    export_parser.add_argument("table", choices=["users", "history"])
+    export_parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    export_parser.add_argument("--out", help="output file (default: stdout)")
+    export_parser.add_argument("--uid", help="only this user's history")
+    export_parser.set_defaults(func=export)
+
+    delete_parser = commands.add_parser("delete-users", help="delete users and all their data")
+    delete_parser.add_argument("uids", nargs="*")
+    delete_parser.add_argument("--file", help="file with one uid per line")
+    delete_parser.set_defaults(func=delete_users_command)
+
+    clear_parser = commands.add_parser("clear", help="delete every row of a table")
+    clear_parser.add_argument("table", choices=["users", "history"])
+    clear_parser.add_argument("--yes", action="store_true")
+    clear_parser.set_defaults(func=clear)
+
+    commands.add_parser(
+        "gc-problems", help="delete problems no history row references"
+    ).set_defaults(func=gc_problems)
+
+    stats_parser = commands.add_parser("rebuild-stats", help="recompute user_stats")
+    stats_parser.add_argument("uid", nargs="?")
+    stats_parser.set_defaults(func=rebuild_stats)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,21 @@
 # UTILITY FUNCTION TO MANAGE USERS
+# Thin wrapper kept for muscle memory; see db_admin.py for the full CLI.
 
-import sqlitecloud
-import os
-from dotenv import load_dotenv
+from db_admin import main
 
-load_dotenv()
-
-DATABASE_URL = os.getenv('SQLITECLOUD_CONN_STRING')
-DATABASE_NAME = os.getenv('SQLITECLOUD_DB_NAME')
-
-def get_connection():
-    conn = sqlitecloud.connect(DATABASE_URL)
-    conn.execute(f"USE DATABASE {DATABASE_NAME}")
-    return conn
 
 def clear_users_table():
-    conn = get_connection()
-    try:
-        conn.execute("DELETE FROM users")
-        conn.commit() 
-        print("All entries in the 'users' table have been deleted.")
-    except Exception as e:
-        print(f"Error while clearing the 'users' table: {str(e)}")
-    finally:
-        conn.close()
+    main(["clear", "users", "--yes"])
+
 
 def delete_user_by_uid(uid):
-    conn = get_connection()
-    try:
-        conn.execute("DELETE FROM users WHERE uid = ?", (uid,))
-        conn.commit()
-        print(f"User with UID {uid} has been deleted.")
-    except Exception as e:
-        print(f"Error while deleting user with UID {uid}: {str(e)}")
+    main(["delete-users", uid])
+
+
 def clear_user_history():
-    conn = get_connection()
-    try:
-        conn.execute("DELETE FROM userhistory")
-        conn.commit()
-    except Exception as e:
-        print(f"Error while clearing the 'users' table: {str(e)}")
-    finally:
-        conn.close()
+    main(["clear", "history", "--yes"])
+
 
 if __name__ == '__main__':
-    # clear_users_table() 
+    # clear_users_table()
     delete_user_by_uid('qeLQEOVDDHOVuY6jxnlyqdGD3bH2')  # Delete a specific user by UID
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from APIs import getLeetCode
+from APIs.getLeetCode import LeetCodeClient, getLeetCodeInfo
+
+STATS = [
+    {"difficulty": "Hard", "count": 1, "submissions": 4},
+    {"difficulty": "All", "count": 10, "submissions": 20},
+    {"difficulty": "Easy", "count": 6, "submissions": 8},
+]
+
+
+class StandIn(BaseHTTPRequestHandler):
+    # A local leetcode.com/graphql: the username variable picks the reply
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        username = body["variables"]["username"]
+        self.server.requests.append((body, self.client_address[1]))
+
+        user = {"username": username, "submitStats": {"acSubmissionNum": STATS}}
+        status, reply = 200, {"data": {"matchedUser": user}}
+        if username == "ghost":
+            reply = {"data": {"matchedUser": None}}
+        elif username == "invalid":
+            reply = {"errors": [{"message": "bad query"}]}
+        elif username == "broken":
+            status, reply = 500, {"message": "down"}
+        elif username == "slow":
+            time.sleep(1)
+
+        out = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    url = f"http://127.0.0.1:{server.server_port}/graphql"
+    client = LeetCodeClient(url=url, timeout=(1, 0.3))
+    monkeypatch.setattr(getLeetCode, "leetcode_client", client)
+    return client
+
+
+def test_ratios_are_looked_up_by_difficulty(client):
+    # Reply order differs from the returned order and Medium is missing
+    assert getLeetCodeInfo("alice") == (0.5, 0.75, 0, 0.25)
+
+
+def test_username_is_sent_as_a_variable(client, server):
+    getLeetCodeInfo('a"b')
+    body, _ = server.requests[0]
+    assert body["variables"] == {"username": 'a"b'}
+    assert 'a"b' not in body["query"]
+
+
+def test_cache_hit_skips_the_request(client, server):
+    assert getLeetCodeInfo("alice") == getLeetCodeInfo("alice")
+    assert len(server.requests) == 1
+    assert client.cache.stats()["hits"] == 1
+
+
+def test_session_is_pooled(client, server):
+    getLeetCodeInfo("alice")
+    getLeetCodeInfo("bob")
+    assert client._get_session() is client._get_session()
+    # Both requests went over the same kept-alive connection
+    assert server.requests[0][1] == server.requests[1][1]
+
+
+def test_connect_and_read_timeouts_are_passed(client, monkeypatch):
+    session = client._get_session()
+    seen = []
+    post = session.post
+
+    def spy(*args, **kwargs):
+        seen.append(kwargs["timeout"])
+        return post(*args, **kwargs)
+
+    monkeypatch.setattr(session, "post", spy)
+    getLeetCodeInfo("alice")
+    assert seen == [(1, 0.3)]
+
+
+def test_read_timeout_returns_na_quickly(client):
+    started = time.monotonic()
+    assert getLeetCodeInfo("slow") == "N/A"
+    assert time.monotonic() - started < 0.9
+
+
+def test_unknown_user_is_not_cached(client, server):
+    assert getLeetCodeInfo("ghost") == "N/A"
+    assert getLeetCodeInfo("ghost") == "N/A"
+    assert len(server.requests) == 2
+
+
+@pytest.mark.parametrize("username", ["invalid", "broken"])
+def test_errors_return_na(client, username):
+    assert getLeetCodeInfo(username) == "N/A"
+    assert client.cache.stats()["size"] == 0
+
+
+def test_unreachable_host_returns_na(monkeypatch):
+    # Nothing listens on port 9 locally, so the connection is refused
+    client = LeetCodeClient(url="http://127.0.0.1:9/graphql", timeout=(0.5, 0.5))
+    monkeypatch.setattr(getLeetCode, "leetcode_client", client)
+    assert getLeetCodeInfo("alice") == "N/A"